@@ -56,6 +56,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Serve static files in production
+    'django.middleware.gzip.GZipMiddleware',  # Compress dynamic responses (static files are pre-compressed by WhiteNoise)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -105,6 +106,22 @@ else:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+    # Covering indexes (Index.include) are PostgreSQL-only; SQLite builds them without the extra columns
+    SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Uses REDIS_URL environment variable if set, so every worker process and the scheduler
+# share cached portfolio data and its invalidation; falls back to per-process local memory
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
 
 
 # Password validation
@@ -3,77 +3,97 @@ Admin configuration for dpk-data.
 Portfolio management.
 """
 from django.contrib import admin
+from django.core.cache import cache
 from .models import (
     Portfolio, Trade, CashTransaction, 
     MarketDataCache, TransactionLog, DailySnapshot,
     PriceHistory, DividendHistory, LiveQuote, SiteSettings
 )
+from .tasks import run_per_portfolio
+
+
+PORTFOLIO_CHOICES_CACHE_KEY = 'admin:portfolio_choices'
+
+
+class PortfolioListFilter(admin.RelatedFieldListFilter):
+    """Portfolio sidebar filter whose choices are cached instead of queried on every changelist load."""
+
+    def field_choices(self, field, request, model_admin):
+        choices = cache.get(PORTFOLIO_CHOICES_CACHE_KEY)
+        if choices is None:
+            choices = [(p.pk, str(p)) for p in Portfolio.objects.order_by('name')]
+            cache.set(PORTFOLIO_CHOICES_CACHE_KEY, choices, 300)
+        return choices
 
 
 @admin.register(Portfolio)
 class PortfolioAdmin(admin.ModelAdmin):
     list_display = ('name', 'currency', 'created_at')
+    search_fields = ('name',)
+    ordering = ['name']
     actions = ['update_live_quotes', 'run_eod_update', 'full_rebuild_v3']
 
     @admin.action(description='🔄 Update Live Quotes (intraday prices)')
     def update_live_quotes(self, request, queryset):
         from .services import PortfolioEngineV3
-        for portfolio in queryset:
-            try:
-                result = PortfolioEngineV3.update_live_quotes(portfolio)
-                self.message_user(
-                    request, 
-                    f"✅ {portfolio.name}: Updated {result.get('updated', 0)}/{result.get('total_tickers', 0)} live quotes"
-                )
-            except Exception as e:
-                self.message_user(request, f"❌ Error updating live quotes for {portfolio.name}: {str(e)}", level='error')
+        for portfolio, result, error in run_per_portfolio(queryset, PortfolioEngineV3.update_live_quotes):
+            if error:
+                self.message_user(request, f"❌ Error updating live quotes for {portfolio.name}: {str(error)}", level='error')
+                continue
+            self.message_user(
+                request, 
+                f"✅ {portfolio.name}: Updated {result.get('updated', 0)}/{result.get('total_tickers', 0)} live quotes"
+            )
     
     @admin.action(description='📊 Run EOD Update (incremental NAV)')
     def run_eod_update(self, request, queryset):
         from .services import PortfolioEngineV3
-        for portfolio in queryset:
-            try:
-                result = PortfolioEngineV3.incremental_eod_update(portfolio)
-                if result.get('status') == 'success':
-                    self.message_user(
-                        request,
-                        f"✅ {portfolio.name}: NAV={result['nav']:.2f}, Value=${result['total_value']:,.2f}, Return={result['total_return_pct']:.2f}%"
-                    )
-                else:
-                    self.message_user(
-                        request,
-                        f"⚠️ {portfolio.name}: {result.get('message', result.get('status'))}",
-                        level='warning'
-                    )
-            except Exception as e:
-                self.message_user(request, f"❌ Error running EOD for {portfolio.name}: {str(e)}", level='error')
+        for portfolio, result, error in run_per_portfolio(queryset, PortfolioEngineV3.incremental_eod_update):
+            if error:
+                self.message_user(request, f"❌ Error running EOD for {portfolio.name}: {str(error)}", level='error')
+            elif result.get('status') == 'success':
+                self.message_user(
+                    request,
+                    f"✅ {portfolio.name}: NAV={result['nav']:.2f}, Value=${result['total_value']:,.2f}, Return={result['total_return_pct']:.2f}%"
+                )
+            else:
+                self.message_user(
+                    request,
+                    f"⚠️ {portfolio.name}: {result.get('message', result.get('status'))}",
+                    level='warning'
+                )
     
     @admin.action(description='🔧 Full Rebuild V3 (prices, dividends, transactions, NAV)')
     def full_rebuild_v3(self, request, queryset):
         from .services import PortfolioEngineV3
-        for portfolio in queryset:
-            try:
-                result = PortfolioEngineV3.full_rebuild(portfolio)
-                nav_result = result.get('nav', {})
-                self.message_user(
-                    request,
-                    f"✅ {portfolio.name}: Full rebuild complete. NAV={nav_result.get('final_nav', 0):.2f}, Return={nav_result.get('total_return_pct', 0):.2f}%"
-                )
-            except Exception as e:
-                self.message_user(request, f"❌ Error rebuilding {portfolio.name}: {str(e)}", level='error')
+        # Trades and cash transactions are read by several rebuild stages; load them once per portfolio
+        portfolios = queryset.prefetch_related('trades', 'cash_transactions')
+        for portfolio, result, error in run_per_portfolio(portfolios, PortfolioEngineV3.full_rebuild, max_workers=2):
+            if error:
+                self.message_user(request, f"❌ Error rebuilding {portfolio.name}: {str(error)}", level='error')
+                continue
+            nav_result = result.get('nav', {})
+            self.message_user(
+                request,
+                f"✅ {portfolio.name}: Full rebuild complete. NAV={nav_result.get('final_nav', 0):.2f}, Return={nav_result.get('total_return_pct', 0):.2f}%"
+            )
 
 
 @admin.register(Trade)
 class TradeAdmin(admin.ModelAdmin):
     list_display = ('portfolio', 'ticker', 'side', 'quantity', 'price', 'date')
-    list_filter = ('portfolio', 'side', 'ticker')
+    list_filter = (('portfolio', PortfolioListFilter), 'side', 'ticker')
     search_fields = ('ticker',)
+    list_select_related = ('portfolio',)
+    autocomplete_fields = ('portfolio',)
 
 
 @admin.register(CashTransaction)
 class CashTransactionAdmin(admin.ModelAdmin):
     list_display = ('portfolio', 'type', 'amount', 'date')
-    list_filter = ('portfolio', 'type')
+    list_filter = (('portfolio', PortfolioListFilter), 'type')
+    list_select_related = ('portfolio',)
+    autocomplete_fields = ('portfolio',)
 
 
 @admin.register(MarketDataCache)
@@ -90,15 +110,40 @@ class MarketDataCacheAdmin(admin.ModelAdmin):
 @admin.register(TransactionLog)
 class TransactionLogAdmin(admin.ModelAdmin):
     list_display = ('date', 'portfolio', 'type', 'ticker', 'shares', 'amount', 'source_type')
-    list_filter = ('portfolio', 'type', 'source_type')
+    list_filter = (('portfolio', PortfolioListFilter), 'type', 'source_type')
     search_fields = ('ticker',)
     ordering = ['-date']
+    list_select_related = ('portfolio',)
+    autocomplete_fields = ('portfolio',)
     actions = ['rebuild_transaction_log', 'recalculate_nav']
     
+    # Single-row edits expire the portfolio's derived data (FIFO lots, holdings) here rather than
+    # in a post_delete signal, which would make every bulk log rebuild delete row by row
+    @staticmethod
+    def _invalidate(portfolio_ids):
+        from .services import PortfolioEngineV3
+        for portfolio_id in set(portfolio_ids):
+            PortfolioEngineV3.invalidate_cache(Portfolio(id=portfolio_id))
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # A row moved to another portfolio changes both
+        self._invalidate([obj.portfolio_id, form.initial.get('portfolio', obj.portfolio_id)])
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self._invalidate([obj.portfolio_id])
+    
+    def delete_queryset(self, request, queryset):
+        portfolio_ids = list(queryset.order_by().values_list('portfolio_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        self._invalidate(portfolio_ids)
+    
     @admin.action(description='Rebuild Transaction Log (from trades/cash/dividends)')
     def rebuild_transaction_log(self, request, queryset):
         from .services import PortfolioEngineV3
-        portfolios = set(t.portfolio for t in queryset)
+        portfolio_ids = queryset.order_by().values_list('portfolio_id', flat=True).distinct()
+        portfolios = Portfolio.objects.filter(id__in=portfolio_ids)
         for portfolio in portfolios:
             try:
                 result = PortfolioEngineV3.build_transaction_log(portfolio)
@@ -109,7 +154,8 @@ class TransactionLogAdmin(admin.ModelAdmin):
     @admin.action(description='Recalculate NAV')
     def recalculate_nav(self, request, queryset):
         from .services import PortfolioEngineV3
-        portfolios = set(t.portfolio for t in queryset)
+        portfolio_ids = queryset.order_by().values_list('portfolio_id', flat=True).distinct()
+        portfolios = Portfolio.objects.filter(id__in=portfolio_ids)
         for portfolio in portfolios:
             try:
                 result = PortfolioEngineV3.calculate_nav(portfolio)
@@ -121,7 +167,9 @@ class TransactionLogAdmin(admin.ModelAdmin):
 @admin.register(DailySnapshot)
 class DailySnapshotAdmin(admin.ModelAdmin):
     list_display = ('date', 'portfolio', 'nav', 'total_value', 'total_units', 'cash_balance')
-    list_filter = ('portfolio',)
+    list_filter = (('portfolio', PortfolioListFilter),)
+    list_select_related = ('portfolio',)
+    autocomplete_fields = ('portfolio',)
     ordering = ['-date']
 
 
@@ -154,15 +202,15 @@ class LiveQuoteAdmin(admin.ModelAdmin):
         from .models import Portfolio
         from .services import PortfolioEngineV3
         
-        total_updated = 0
-        for portfolio in Portfolio.objects.all():
-            try:
-                result = PortfolioEngineV3.update_live_quotes(portfolio)
-                total_updated += result.get('updated', 0)
-            except Exception as e:
-                self.message_user(request, f"Error updating {portfolio.name}: {str(e)}", level='error')
+        try:
+            result = PortfolioEngineV3.update_live_quotes_bulk(Portfolio.objects.all())
+        except Exception as e:
+            self.message_user(request, f"Error refreshing live quotes: {str(e)}", level='error')
+            return
         
-        self.message_user(request, f"✅ Refreshed {total_updated} live quotes across all portfolios")
+        for error in result.get('errors', []):
+            self.message_user(request, error, level='error')
+        self.message_user(request, f"✅ Refreshed {result.get('updated', 0)} live quotes across all portfolios")
 
 
 @admin.register(SiteSettings)
@@ -216,9 +264,10 @@ class FintestQuestionAdmin(admin.ModelAdmin):
         }),
     )
 
+    @admin.display(description="Question Text")
     def text_preview(self, obj):
-        return obj.text[:80] + "..." if len(obj.text) > 80 else obj.text
-    text_preview.short_description = "Question Text"
+        text = obj.text
+        return text[:80] + "..." if len(text) > 80 else text
 
 
 @admin.register(FintestResult)
@@ -2,14 +2,24 @@
 Public JSON API views for WordPress consumption.
 No authentication required. CORS restricted to delopahnetkerosinom.ru.
 """
-from django.http import JsonResponse, HttpResponse
+import functools
+import gzip
+import hashlib
+import re
+import time
+from decimal import Decimal
+import orjson
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
 from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag
+from .models import Portfolio
+from .services import CACHE_TIMEOUT, CHART_CACHE_TIMEOUT, PortfolioEngineV3
 
 
-@staff_member_required
-def api_index(request):
-    """Public API documentation page with clickable endpoint links."""
-    html = """<!DOCTYPE html>
+_API_INDEX_HTML = """<!DOCTYPE html>
 <html><head>
 <meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">
 <title>dpk-data API</title>
@@ -49,8 +59,16 @@ def api_index(request):
 </table>
 
 <p class="note">CORS: restricted to delopahnetkerosinom.ru &middot; Cache: 5 min</p>
-</body></html>"""
-    return HttpResponse(html)
+</body></html>""".encode('utf-8')
+_API_INDEX_ETAG = '"%s"' % hashlib.md5(_API_INDEX_HTML).hexdigest()
+
+
+@staff_member_required
+@etag(lambda request: _API_INDEX_ETAG)
+@cache_control(private=True, max_age=3600)
+def api_index(request):
+    """Public API documentation page with clickable endpoint links."""
+    return HttpResponse(_API_INDEX_HTML, content_type='text/html; charset=utf-8')
 
 ALLOWED_ORIGIN = 'https://delopahnetkerosinom.ru'
 
@@ -61,9 +79,26 @@ PORTFOLIO_IDS = {
 }
 
 
+def _json_default(obj):
+    """orjson fallback for types it does not encode natively (matches DjangoJSONEncoder)."""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError
+
+
+def dumps(data):
+    """Encode an API payload to JSON bytes."""
+    return orjson.dumps(data, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
 def cors_response(data, status=200):
-    """Create a JsonResponse with CORS headers."""
-    response = JsonResponse(data, status=status)
+    """Create a JSON response with CORS headers."""
+    return cors_response_bytes(dumps(data), status=status)
+
+
+def cors_response_bytes(body, status=200):
+    """Create a JSON response with CORS headers from an already encoded body."""
+    response = HttpResponse(body, content_type='application/json', status=status)
     response['Access-Control-Allow-Origin'] = ALLOWED_ORIGIN
     response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
     response['Access-Control-Allow-Headers'] = 'Content-Type'
@@ -71,84 +106,169 @@ def cors_response(data, status=200):
     return response
 
 
+_PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': ALLOWED_ORIGIN,
+    'Access-Control-Allow-Methods': 'GET, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Max-Age': '86400',
+}
+
+
 def cors_preflight():
     """Handle OPTIONS preflight request."""
-    response = JsonResponse({})
-    response['Access-Control-Allow-Origin'] = ALLOWED_ORIGIN
-    response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
-    response['Access-Control-Allow-Headers'] = 'Content-Type'
-    response['Access-Control-Max-Age'] = '86400'
+    return HttpResponse(b'{}', content_type='application/json', headers=_PREFLIGHT_HEADERS)
+
+
+# slug -> (expires_at, Portfolio), filled on first use. Cleared by the Portfolio post_save/post_delete
+# signals in the saving process; the others pick up the change when the entry expires.
+_portfolios = {}
+
+
+def clear_portfolio_cache():
+    """Forget resolved Portfolio objects so the next request reloads them."""
+    _portfolios.clear()
+
+
+def get_portfolio(portfolio_type):
+    """
+    Get portfolio by type ('active' or 'passive').
+    The slug -> Portfolio mapping rarely changes, so the object is kept in process
+    memory for CACHE_TIMEOUT: a dict hit, with no cache backend call per request.
+    """
+    now = time.monotonic()
+    expires_at, portfolio = _portfolios.get(portfolio_type, (0, None))
+    if expires_at <= now:
+        pid = PORTFOLIO_IDS.get(portfolio_type)
+        if not pid:
+            return None
+        # Engine methods only filter by the portfolio, so skip loading the other columns
+        portfolio = Portfolio.objects.only('id', 'name', 'currency').filter(id=pid).first()
+        if portfolio is None:
+            return None
+        _portfolios[portfolio_type] = (now + CACHE_TIMEOUT, portfolio)
+    return portfolio
+
+
+_ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+def _encode(payload):
+    """Encode a payload to (body, gzipped_body); gzipped_body is None when compression would not make it smaller."""
+    body = dumps(payload)
+    compressed = gzip.compress(body, compresslevel=6)
+    return body, compressed if len(compressed) < len(body) else None
+
+
+def _cached_body(portfolio, name, build, timeout=CACHE_TIMEOUT):
+    """
+    Return (body, gzipped_body) for an endpoint, building both at most once per cache window.
+    Cache hits skip the engine call, JSON encoding and compression.
+    """
+    key = PortfolioEngineV3.cache_key(portfolio, f'api:{name}')
+    bodies = cache.get(key)
+    if bodies is None:
+        bodies = _encode(build())
+        cache.set(key, bodies, timeout)
+    return bodies
+
+
+def _encoded_response(request, bodies):
+    """CORS JSON response using the pre-compressed body when the client accepts gzip."""
+    body, compressed = bodies
+    if compressed is not None and _ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = cors_response_bytes(compressed)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = cors_response_bytes(body)
+    patch_vary_headers(response, ('Accept-Encoding',))
     return response
 
 
-def _get_portfolio(portfolio_type):
-    """Get portfolio by type ('active' or 'passive')."""
-    from .models import Portfolio
-    pid = PORTFOLIO_IDS.get(portfolio_type)
-    if not pid:
-        return None
-    return Portfolio.objects.filter(id=pid).first()
+def portfolio_endpoint(build=None, *, timeout=CACHE_TIMEOUT):
+    """
+    Decorator for public portfolio endpoints.
+    Handles the OPTIONS preflight, resolves the portfolio (404 if missing) and serves
+    the cached encoded payload; the decorated function only maps a Portfolio to the
+    JSON-serializable payload. The resulting view takes (request, portfolio_type).
+    timeout sets how long the encoded payload stays cached.
+    """
+    if build is None:
+        return functools.partial(portfolio_endpoint, timeout=timeout)
+    name = build.__name__.lstrip('_')
+    
+    @functools.wraps(build)
+    def view(request, portfolio_type):
+        if request.method == 'OPTIONS':
+            return cors_preflight()
+        portfolio = get_portfolio(portfolio_type)
+        if not portfolio:
+            return cors_response({'error': 'Portfolio not found'}, status=404)
+        bodies = _cached_body(portfolio, name, lambda: build(portfolio), timeout)
+        return _encoded_response(request, bodies)
+    
+    def prime(portfolio):
+        """Build, encode and cache the payload ahead of the first request."""
+        key = PortfolioEngineV3.cache_key(portfolio, f'api:{name}')
+        cache.set(key, _encode(build(portfolio)), timeout)
+    
+    view.prime = prime
+    return view
 
 
 # ============================================================
 # Generic endpoint builders
 # ============================================================
+# Engine results go through PortfolioEngineV3.cached_call() so endpoints that
+# share a computation (performance / performance-summary, holdings /
+# holdings-summary) compute it once per portfolio until the next invalidation.
+# The cached lists are shared: copy before reordering, never mutate in place.
+
+@portfolio_endpoint
+def _yearly_performance(portfolio):
+    data = PortfolioEngineV3.cached_call(portfolio, 'get_yearly_performance')
+    # Reverse order: current year first (the engine returns years ascending)
+    return {'data': data[::-1]}
 
-def _yearly_performance(request, portfolio_type):
-    if request.method == 'OPTIONS':
-        return cors_preflight()
-    from .services import PortfolioEngineV3
-    portfolio = _get_portfolio(portfolio_type)
-    if not portfolio:
-        return cors_response({'error': 'Portfolio not found'}, status=404)
-    data = PortfolioEngineV3.get_yearly_performance(portfolio)
-    # Reverse order: current year first
-    data.sort(key=lambda x: x['year'], reverse=True)
-    return cors_response({'data': data})
-
-
-def _chart_weekly_performance(request, portfolio_type):
-    if request.method == 'OPTIONS':
-        return cors_preflight()
-    from .services import PortfolioEngineV3
-    portfolio = _get_portfolio(portfolio_type)
-    if not portfolio:
-        return cors_response({'error': 'Portfolio not found'}, status=404)
+
+@portfolio_endpoint(timeout=CHART_CACHE_TIMEOUT)
+def _chart_weekly_performance(portfolio):
     data = PortfolioEngineV3.get_weekly_chart_data(portfolio)
-    return cors_response({'nav_pct': data.get('nav_pct', [])})
+    return {'nav_pct': data.get('nav_pct', [])}
 
 
-def _chart_weekly_value(request, portfolio_type):
-    if request.method == 'OPTIONS':
-        return cors_preflight()
-    from .services import PortfolioEngineV3
-    portfolio = _get_portfolio(portfolio_type)
-    if not portfolio:
-        return cors_response({'error': 'Portfolio not found'}, status=404)
+@portfolio_endpoint(timeout=CHART_CACHE_TIMEOUT)
+def _chart_weekly_value(portfolio):
     data = PortfolioEngineV3.get_weekly_chart_data(portfolio)
-    return cors_response({'value': data.get('value', [])})
+    return {'value': data.get('value', [])}
+
+
+@portfolio_endpoint
+def _current_holdings(portfolio):
+    return {'data': PortfolioEngineV3.cached_call(portfolio, 'get_current_holdings')}
+
+
+@portfolio_endpoint
+def _closed_positions(portfolio):
+    return {'data': PortfolioEngineV3.cached_call(portfolio, 'get_closed_positions')}
+
+
+@portfolio_endpoint
+def _performance_summary(portfolio):
+    full_data = PortfolioEngineV3.cached_call(portfolio, 'get_yearly_performance')
+    # The engine returns years in ascending order (already floats), so walk it backwards
+    summary = [{'year': d['year'], 'return_pct': round(d['return_pct'], 2)} for d in reversed(full_data)]
+    return {'data': summary}
 
 
-def _current_holdings(request, portfolio_type):
-    if request.method == 'OPTIONS':
-        return cors_preflight()
-    from .services import PortfolioEngineV3
-    portfolio = _get_portfolio(portfolio_type)
-    if not portfolio:
-        return cors_response({'error': 'Portfolio not found'}, status=404)
-    data = PortfolioEngineV3.get_current_holdings(portfolio)
-    return cors_response({'data': data})
+@portfolio_endpoint
+def _holdings_summary(portfolio):
+    return {'data': PortfolioEngineV3.get_current_holdings_summary(portfolio)}
 
 
-def _closed_positions(request, portfolio_type):
-    if request.method == 'OPTIONS':
-        return cors_preflight()
-    from .services import PortfolioEngineV3
-    portfolio = _get_portfolio(portfolio_type)
-    if not portfolio:
-        return cors_response({'error': 'Portfolio not found'}, status=404)
-    data = PortfolioEngineV3.get_closed_positions(portfolio)
-    return cors_response({'data': data})
+def prime_chart_cache(portfolio):
+    """Pre-encode the weekly chart payloads so requests after the EOD update are served from cache."""
+    _chart_weekly_performance.prime(portfolio)
+    _chart_weekly_value.prime(portfolio)
 
 
 # ============================================================
@@ -186,16 +306,7 @@ def api_passive_performance(request):
 
 def api_passive_performance_summary(request):
     """Yearly return % only for the passive portfolio — no NAV or dollar values."""
-    if request.method == 'OPTIONS':
-        return cors_preflight()
-    from .services import PortfolioEngineV3
-    portfolio = _get_portfolio('passive')
-    if not portfolio:
-        return cors_response({'error': 'Portfolio not found'}, status=404)
-    full_data = PortfolioEngineV3.get_yearly_performance(portfolio)
-    full_data.sort(key=lambda x: x['year'], reverse=True)
-    summary = [{'year': d['year'], 'return_pct': round(d['return_pct'], 2)} for d in full_data]
-    return cors_response({'data': summary})
+    return _performance_summary(request, 'passive')
 
 def api_passive_chart_performance(request):
     """Weekly NAV % return chart for the passive portfolio."""
@@ -211,22 +322,7 @@ def api_passive_current_holdings(request):
 
 def api_passive_holdings_summary(request):
     """Holdings summary for passive portfolio — no dollar values exposed."""
-    if request.method == 'OPTIONS':
-        return cors_preflight()
-    from .services import PortfolioEngineV3
-    portfolio = _get_portfolio('passive')
-    if not portfolio:
-        return cors_response({'error': 'Portfolio not found'}, status=404)
-    full_data = PortfolioEngineV3.get_current_holdings(portfolio)
-    # Strip dollar values, keep only: ticker, weight, avg cost, price, P&L %
-    summary = [{
-        'ticker': h['ticker'],
-        'weight_pct': h.get('weight_pct', 0),
-        'avg_cost': round(h.get('avg_cost', 0), 2),
-        'current_price': round(h.get('current_price', 0), 2),
-        'pnl_pct': round(h.get('unrealized_pnl_pct', 0), 2),
-    } for h in full_data]
-    return cors_response({'data': summary})
+    return _holdings_summary(request, 'passive')
 
 def api_passive_closed_positions(request):
     """Closed positions for the passive portfolio."""
@@ -9,8 +9,10 @@ class CoreConfig(AppConfig):
     def ready(self):
         """
         Called when Django is ready.
-        Start the portfolio price scheduler if enabled.
+        Connect signal handlers and start the portfolio price scheduler if enabled.
         """
+        from . import signals  # noqa: F401
+        
         # Avoid running scheduler twice in development (Django auto-reloader)
         # RUN_MAIN is set by the reloader; we only start scheduler when it's 'true'
         # or when not using runserver (e.g., gunicorn, uwsgi)
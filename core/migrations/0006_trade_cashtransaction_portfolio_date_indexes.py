@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-15 00:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_fintestquestion_edition_fintestresult_edition_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashtransaction',
+            index=models.Index(fields=['portfolio', 'date'], name='core_cashtr_portfol_a48440_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['portfolio', 'date'], name='core_trade_portfol_6afe33_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-15 00:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_trade_cashtransaction_portfolio_date_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='dailysnapshot',
+            name='core_dailys_portfol_1c9e69_idx',
+        ),
+        migrations.AddIndex(
+            model_name='dailysnapshot',
+            index=models.Index(fields=['portfolio', 'date'], include=('nav', 'total_value'), name='dsnap_chart_cover'),
+        ),
+    ]
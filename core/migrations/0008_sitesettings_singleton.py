@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-15 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_dailysnapshot_chart_covering_index'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='sitesettings',
+            constraint=models.CheckConstraint(condition=models.Q(('id', 1)), name='sitesettings_singleton'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def negate_outflows(apps, schema_editor):
+    """BUY and WITHDRAWAL rows store their cash impact as a negative amount."""
+    TransactionLog = apps.get_model('core', 'TransactionLog')
+    TransactionLog.objects.filter(type__in=('BUY', 'WITHDRAWAL'), amount__gt=0).update(amount=-F('amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_sitesettings_singleton'),
+    ]
+
+    operations = [
+        migrations.RunPython(negate_outflows, migrations.RunPython.noop),
+    ]
@@ -3,6 +3,7 @@ dpk-data models: Portfolio entities.
 Lab-specific models (StockValuation, FinancialStatement, etc.) are in dpk-lab.
 """
 from django.db import models
+from django.utils import timezone
 
 
 # ============================================================
@@ -30,6 +31,11 @@ class Trade(models.Model):
     fees = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['portfolio', 'date']),
+        ]
+
     def __str__(self):
         return f"{self.side} {self.quantity} {self.ticker} @ {self.price}"
 
@@ -44,6 +50,11 @@ class CashTransaction(models.Model):
     note = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['portfolio', 'date']),
+        ]
+
     def __str__(self):
         return f"{self.type} {self.amount} ({self.date.date()})"
 
@@ -211,7 +222,7 @@ class TransactionLog(models.Model):
     ticker = models.CharField(max_length=10, blank=True, null=True)  # For BUY/SELL/DIVIDEND
     shares = models.DecimalField(max_digits=15, decimal_places=4, blank=True, null=True)
     price = models.DecimalField(max_digits=15, decimal_places=4, blank=True, null=True)
-    amount = models.DecimalField(max_digits=15, decimal_places=2)  # Total cash impact
+    amount = models.DecimalField(max_digits=15, decimal_places=2)  # Signed cash impact (BUY/WITHDRAWAL < 0)
     commission = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     source_id = models.IntegerField(blank=True, null=True)  # ID from source table
     source_type = models.CharField(max_length=20, choices=SOURCE_CHOICES, blank=True, null=True)
@@ -245,7 +256,9 @@ class DailySnapshot(models.Model):
         unique_together = ('portfolio', 'date')
         ordering = ['date']
         indexes = [
-            models.Index(fields=['portfolio', 'date']),
+            # Covering index for the chart series (date, nav, total_value): index-only scan
+            # on PostgreSQL; other backends ignore INCLUDE and get a plain (portfolio, date) index
+            models.Index(fields=['portfolio', 'date'], include=['nav', 'total_value'], name='dsnap_chart_cover'),
         ]
     
     def __str__(self):
@@ -296,6 +309,10 @@ class SiteSettings(models.Model):
     class Meta:
         verbose_name = "Site Settings"
         verbose_name_plural = "Site Settings"
+        constraints = [
+            # Enforce the singleton in the DB too, for writes that bypass save()
+            models.CheckConstraint(condition=models.Q(id=1), name='sitesettings_singleton'),
+        ]
     
     def __str__(self):
         return "Site Settings"
@@ -306,6 +323,14 @@ class SiteSettings(models.Model):
         settings, _ = cls.objects.get_or_create(pk=1)
         return settings
     
+    @classmethod
+    def record_quote_update(cls, count):
+        """Store the time and ticker count of the latest quote update (single UPDATE, no SELECT)."""
+        now = timezone.now()
+        if not cls.objects.filter(pk=1).update(last_quote_update=now, last_update_count=count):
+            cls.objects.update_or_create(pk=1, defaults={'last_quote_update': now, 'last_update_count': count})
+        return now
+    
     def save(self, *args, **kwargs):
         # Ensure only one instance exists
         self.pk = 1
@@ -8,16 +8,35 @@ This module runs background tasks to:
 To start the scheduler, import and call start_scheduler() in your Django app's ready() method
 or run it as a standalone process.
 """
+import functools
 import logging
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from django.conf import settings
+from django.db import close_old_connections
 
 logger = logging.getLogger(__name__)
 
 scheduler = None
 
 
+def db_job(job):
+    """
+    Wrap a scheduler job so the scheduler thread's DB connection is checked before and after it runs.
+    Outside the request cycle nothing else recycles it; close_old_connections() drops it
+    once it is broken or older than CONN_MAX_AGE, and otherwise keeps it for the next run.
+    """
+    @functools.wraps(job)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return job(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return wrapper
+
+
+@db_job
 def update_live_quotes_job():
     """
     Job to update live quotes for all portfolios.
@@ -25,7 +44,6 @@ def update_live_quotes_job():
     """
     from core.models import Portfolio, SiteSettings
     from core.services import PortfolioEngineV3
-    from django.utils import timezone
     
     # Only run if market is open
     if not PortfolioEngineV3.is_us_market_open():
@@ -34,29 +52,29 @@ def update_live_quotes_job():
     
     logger.info("[Scheduler] Running live quote update...")
     
-    total_updated = 0
-    for portfolio in Portfolio.objects.all():
-        try:
-            result = PortfolioEngineV3.update_live_quotes(portfolio)
-            updated = result.get('updated', 0)
-            total_updated += updated
-            logger.info(
-                f"[Scheduler] {portfolio.name}: Updated {updated} quotes"
-            )
-        except Exception as e:
-            logger.error(f"[Scheduler] Error updating {portfolio.name}: {e}")
+    # One batch download for the union of held tickers instead of one per portfolio
+    try:
+        result = PortfolioEngineV3.update_live_quotes_bulk(Portfolio.objects.only('id', 'name'))
+    except Exception as e:
+        logger.error(f"[Scheduler] Error updating live quotes: {e}")
+        return
+    
+    for error in result.get('errors', []):
+        logger.error(f"[Scheduler] {error}")
+    total_updated = result.get('updated', 0)
+    logger.info(
+        f"[Scheduler] Updated {total_updated}/{result.get('total_tickers', 0)} quotes"
+    )
     
     # Update SiteSettings with last update time
     try:
-        settings = SiteSettings.get_settings()
-        settings.last_quote_update = timezone.now()
-        settings.last_update_count = total_updated
-        settings.save()
-        logger.info(f"[Scheduler] Recorded update: {total_updated} tickers at {settings.last_quote_update}")
+        updated_at = SiteSettings.record_quote_update(total_updated)
+        logger.info(f"[Scheduler] Recorded update: {total_updated} tickers at {updated_at}")
     except Exception as e:
         logger.error(f"[Scheduler] Failed to update SiteSettings: {e}")
 
 
+@db_job
 def eod_update_job():
     """
     Job to perform end-of-day updates for all portfolios.
@@ -64,22 +82,27 @@ def eod_update_job():
     """
     from core.models import Portfolio
     from core.services import PortfolioEngineV3
+    from core.api_views import prime_chart_cache
+    from core.tasks import run_per_portfolio
     
     logger.info("[Scheduler] Running end-of-day update...")
     
-    for portfolio in Portfolio.objects.all():
-        try:
-            result = PortfolioEngineV3.incremental_eod_update(portfolio)
-            if result.get('status') == 'success':
-                logger.info(
-                    f"[Scheduler] {portfolio.name}: EOD NAV={result['nav']:.2f}"
-                )
-            else:
-                logger.warning(
-                    f"[Scheduler] {portfolio.name}: {result.get('message', result.get('status'))}"
-                )
-        except Exception as e:
-            logger.error(f"[Scheduler] EOD error for {portfolio.name}: {e}")
+    # Portfolios are independent and mostly wait on yfinance, so run them side by side
+    for portfolio, result, error in run_per_portfolio(Portfolio.objects.only('id', 'name'), PortfolioEngineV3.incremental_eod_update):
+        if error:
+            logger.error(f"[Scheduler] EOD error for {portfolio.name}: {error}")
+        elif result.get('status') == 'success':
+            logger.info(
+                f"[Scheduler] {portfolio.name}: EOD NAV={result['nav']:.2f}"
+            )
+            try:
+                prime_chart_cache(portfolio)
+            except Exception as e:
+                logger.error(f"[Scheduler] Chart cache error for {portfolio.name}: {e}")
+        else:
+            logger.warning(
+                f"[Scheduler] {portfolio.name}: {result.get('message', result.get('status'))}"
+            )
 
 
 def start_scheduler():
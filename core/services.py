@@ -2,12 +2,42 @@
 Services for dpk-data: PortfolioEngineV3 (portfolio performance).
 Lab-specific services (FMPService, AlphaFactorService) are in dpk-lab.
 """
-import yfinance as yf
+import functools
+import hashlib
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, deque
 from decimal import Decimal
+from operator import attrgetter, itemgetter
 from datetime import date, timedelta, datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
 from django.utils import timezone
-from django.db.models import Sum
-import pandas as pd
+from django.db.models import Case, Count, DecimalField, F, Max, Min, Q, Sum, When
+import pytz
+
+from .models import DailySnapshot, DividendHistory, LiveQuote, PriceHistory, Trade, TransactionLog
+
+
+# Derived portfolio data is cached for as long as the public API lets clients cache it
+CACHE_TIMEOUT = 300
+HISTORY_CACHE_TIMEOUT = 60 * 60  # yfinance daily history responses
+QUOTES_CACHE_TIMEOUT = 60  # yfinance latest-close batch downloads
+PRICE_SYNC_INTERVAL = 15 * 60  # page-load price history syncs
+
+# Weekly chart data only changes when a new snapshot is written, so keep it for a day when the
+# cache is shared. With per-process local memory, invalidate_cache() in one worker never reaches
+# the others, so long-lived entries fall back to the regular window.
+SHARED_CACHE = settings.CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+CHART_CACHE_TIMEOUT = 60 * 60 * 24 if SHARED_CACHE else CACHE_TIMEOUT
+
+US_EASTERN = pytz.timezone('US/Eastern')
+
+# Chart timestamps are epoch milliseconds at midnight of the snapshot date (TIME_ZONE is UTC)
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+MS_PER_DAY = 24 * 60 * 60 * 1000
 
 
 # ============================================================
@@ -22,58 +52,180 @@ class PortfolioEngineV3:
     """
     
     @staticmethod
-    def populate_price_history(portfolio):
+    def cache_key(portfolio, name):
+        """
+        Cache key for derived data of a portfolio; changes whenever invalidate_cache() is called.
+        The version starts from the current time, so a version key that was evicted comes back
+        with a value none of the still-cached entries were stored under.
+        """
+        version = cache.get_or_set(f'portfolio:{portfolio.id}:cache_version', time.time_ns, None)
+        return f'portfolio:{portfolio.id}:v{version}:{name}'
+    
+    @staticmethod
+    def invalidate_cache(portfolio):
+        """Expire all cached derived data for a portfolio (after prices, quotes or snapshots change)."""
+        try:
+            cache.incr(f'portfolio:{portfolio.id}:cache_version')
+        except ValueError:
+            pass  # No version key (never set or evicted); the next cache_key() starts a fresh one
+    
+    @staticmethod
+    def cached_call(portfolio, method_name, timeout=CACHE_TIMEOUT):
+        """Return PortfolioEngineV3.<method_name>(portfolio), computing it at most once per timeout."""
+        key = PortfolioEngineV3.cache_key(portfolio, method_name)
+        data = cache.get(key)
+        if data is None:
+            data = getattr(PortfolioEngineV3, method_name)(portfolio)
+            cache.set(key, data, timeout)
+        return data
+    
+    @staticmethod
+    def cached_calls(portfolio, method_names, timeout=CACHE_TIMEOUT):
+        """
+        {name: cached_call(portfolio, name)} for several methods, looked up with one
+        cache round trip; only the misses are computed (and stored together).
+        """
+        prefix = PortfolioEngineV3.cache_key(portfolio, '')
+        data = {
+            key[len(prefix):]: value
+            for key, value in cache.get_many([prefix + name for name in method_names]).items()
+        }
+        missing = {name: getattr(PortfolioEngineV3, name)(portfolio) for name in method_names if name not in data}
+        if missing:
+            cache.set_many({prefix + name: value for name, value in missing.items()}, timeout)
+            data.update(missing)
+        return data
+    
+    @staticmethod
+    def _trades(portfolio):
+        """Portfolio trades ordered by date; served from prefetch_related('trades') when the caller prefetched them."""
+        return sorted(portfolio.trades.all(), key=attrgetter('date'))
+    
+    @staticmethod
+    def _fetch_histories(starts, end, **history_kwargs):
+        """
+        Fetch yf.Ticker(ticker).history(start=starts[ticker], end=end, **history_kwargs) for every ticker.
+        Requests are network-bound, so they run concurrently; DB writes stay with the caller.
+        Non-empty responses are cached for HISTORY_CACHE_TIMEOUT so reruns skip the network.
+        Yields (ticker, hist, error) in input order; exactly one of hist/error is set.
+        """
+        import yfinance as yf
+        
+        options = ':'.join(f'{k}={v}' for k, v in sorted(history_kwargs.items()))
+        
+        def fetch(ticker):
+            key = f'yf:history:{ticker}:{starts[ticker]}:{end}:{options}'
+            hist = cache.get(key)
+            if hist is not None:
+                return ticker, hist, None
+            try:
+                hist = yf.Ticker(ticker).history(start=starts[ticker].isoformat(), end=end.isoformat(), **history_kwargs)
+            except Exception as e:
+                return ticker, None, e
+            if not hist.empty:
+                cache.set(key, hist, HISTORY_CACHE_TIMEOUT)
+            return ticker, hist, None
+        
+        if not starts:
+            return
+        with ThreadPoolExecutor(max_workers=min(8, len(starts))) as pool:
+            yield from pool.map(fetch, starts)
+    
+    @staticmethod
+    def _upsert_daily(model, value_field, ticker, values):
+        """
+        Write {date: value} rows for one ticker with a single bulk INSERT ... ON CONFLICT UPDATE.
+        Returns the number of dates that were not stored before.
+        """
+        if not values:
+            return 0
+        
+        existing = set(
+            model.objects.filter(ticker=ticker, date__range=(min(values), max(values)))
+            .values_list('date', flat=True)
+        )
+        model.objects.bulk_create(
+            [model(ticker=ticker, date=d, **{value_field: v}) for d, v in values.items()],
+            update_conflicts=True,
+            unique_fields=['ticker', 'date'],
+            update_fields=[value_field],
+            batch_size=1000,
+        )
+        return len(values.keys() - existing)
+    
+    @staticmethod
+    def _daily_values(series):
+        """{date: Decimal} for the non-null values of a yfinance history column."""
+        import pandas as pd
+        
+        series = series.dropna()
+        return {d: Decimal(str(v)) for d, v in zip(pd.to_datetime(series.index).date, series.tolist())}
+    
+    @staticmethod
+    def _fill_cash_prices(start, end):
+        """
+        Insert the missing CASH price rows (always 1.0) for every calendar day from start to end inclusive.
+        The value never changes, so existing rows are skipped rather than rewritten. Returns rows added.
+        """
+        existing = set(PriceHistory.objects.filter(ticker='CASH', date__range=(start, end)).values_list('date', flat=True))
+        missing = [
+            PriceHistory(ticker='CASH', date=d, close_price=Decimal('1.0'))
+            for d in (start + timedelta(days=i) for i in range((end - start).days + 1))
+            if d not in existing
+        ]
+        PriceHistory.objects.bulk_create(missing, batch_size=1000, ignore_conflicts=True)
+        return len(missing)
+    
+    @staticmethod
+    def _fetch_full_histories(portfolio):
+        """
+        Fetch unadjusted daily history, including the Dividends column, for every traded ticker
+        from the first trade date to today, as [(ticker, hist, error)].
+        """
+        trades = PortfolioEngineV3._trades(portfolio)
+        if not trades:
+            return []
+        
+        starts = dict.fromkeys((t.ticker for t in trades), trades[0].date.date())
+        return list(PortfolioEngineV3._fetch_histories(starts, date.today() + timedelta(days=1), auto_adjust=False, actions=True))
+    
+    @staticmethod
+    def populate_price_history(portfolio, histories=None):
         """
         Fetch prices from yfinance for all tickers in trades, from first trade date to today.
         Also ensures CASH has price = 1.0 for all dates.
+        histories: result of _fetch_full_histories() to reuse instead of fetching again.
         """
-        from .models import Trade, PriceHistory
-        
-        trades = Trade.objects.filter(portfolio=portfolio)
-        if not trades.exists():
+        trades = PortfolioEngineV3._trades(portfolio)
+        if not trades:
             return {'status': 'no_trades', 'message': 'No trades found'}
         
         # Get unique tickers and date range
-        tickers = list(trades.values_list('ticker', flat=True).distinct())
-        first_trade_date = trades.order_by('date').first().date.date()
+        tickers = list(dict.fromkeys(t.ticker for t in trades))
+        first_trade_date = trades[0].date.date()
         today = date.today()
         
         print(f"[PortfolioEngineV3] Fetching prices for {len(tickers)} tickers from {first_trade_date} to {today}")
         
         prices_added = 0
         
-        for ticker in tickers:
+        if histories is None:
+            histories = PortfolioEngineV3._fetch_full_histories(portfolio)
+        for ticker, hist, error in histories:
+            if error:
+                print(f"[PortfolioEngineV3] Error fetching {ticker}: {error}")
+                continue
+            
             try:
-                t = yf.Ticker(ticker)
-                hist = t.history(start=first_trade_date.isoformat(), end=(today + timedelta(days=1)).isoformat(), auto_adjust=False)
-                
                 if not hist.empty:
-                    hist.index = pd.to_datetime(hist.index).date
-                    
-                    for d, row in hist.iterrows():
-                        if pd.notna(row['Close']):
-                            _, created = PriceHistory.objects.update_or_create(
-                                ticker=ticker,
-                                date=d,
-                                defaults={'close_price': Decimal(str(row['Close']))}
-                            )
-                            if created:
-                                prices_added += 1
+                    closes = PortfolioEngineV3._daily_values(hist['Close'])
+                    prices_added += PortfolioEngineV3._upsert_daily(PriceHistory, 'close_price', ticker, closes)
                                 
             except Exception as e:
                 print(f"[PortfolioEngineV3] Error fetching {ticker}: {e}")
         
         # Add CASH prices (always 1.0)
-        current_date = first_trade_date
-        while current_date <= today:
-            _, created = PriceHistory.objects.update_or_create(
-                ticker='CASH',
-                date=current_date,
-                defaults={'close_price': Decimal('1.0')}
-            )
-            if created:
-                prices_added += 1
-            current_date += timedelta(days=1)
+        prices_added += PortfolioEngineV3._fill_cash_prices(first_trade_date, today)
         
         return {'status': 'success', 'prices_added': prices_added}
     
@@ -81,9 +233,11 @@ class PortfolioEngineV3:
     def update_price_history(portfolio):
         """
         Check last date in PriceHistory and fetch missing data up to today.
-        Called on page load to sync latest prices.
+        Called on page load to sync latest prices, so it runs at most once per
+        PRICE_SYNC_INTERVAL per portfolio; loads in between skip it.
         """
-        from .models import Trade, PriceHistory
+        if not cache.add(f'portfolio:{portfolio.id}:price_sync', True, PRICE_SYNC_INTERVAL):
+            return {'status': 'recently_synced'}
         
         trades = Trade.objects.filter(portfolio=portfolio)
         if not trades.exists():
@@ -91,86 +245,74 @@ class PortfolioEngineV3:
         
         tickers = list(trades.values_list('ticker', flat=True).distinct())
         today = date.today()
+        # On weekends Friday's close is the newest one there is
+        last_session = today - timedelta(days=max(today.weekday() - 4, 0))
+        first_trade_date = trades.order_by('date').values_list('date', flat=True).first().date()
         prices_added = 0
         
+        # Latest stored date per ticker (CASH included) in one grouped query
+        last_dates = dict(
+            PriceHistory.objects.filter(ticker__in=[*tickers, 'CASH']).order_by()
+            .values('ticker').annotate(last=Max('date')).values_list('ticker', 'last')
+        )
+        
+        starts = {}
         for ticker in tickers:
-            last_price = PriceHistory.objects.filter(ticker=ticker).order_by('-date').first()
+            last_date = last_dates.get(ticker)
             
-            if last_price and last_price.date >= today:
+            if last_date and last_date >= last_session:
                 continue  # Already up to date
             
-            start_date = (last_price.date + timedelta(days=1)) if last_price else trades.order_by('date').first().date.date()
+            starts[ticker] = (last_date + timedelta(days=1)) if last_date else first_trade_date
+        
+        for ticker, hist, error in PortfolioEngineV3._fetch_histories(starts, today + timedelta(days=1), auto_adjust=False):
+            if error:
+                print(f"[PortfolioEngineV3] Error updating {ticker}: {error}")
+                continue
             
             try:
-                t = yf.Ticker(ticker)
-                hist = t.history(start=start_date.isoformat(), end=(today + timedelta(days=1)).isoformat(), auto_adjust=False)
-                
                 if not hist.empty:
-                    hist.index = pd.to_datetime(hist.index).date
-                    
-                    for d, row in hist.iterrows():
-                        if pd.notna(row['Close']):
-                            _, created = PriceHistory.objects.update_or_create(
-                                ticker=ticker,
-                                date=d,
-                                defaults={'close_price': Decimal(str(row['Close']))}
-                            )
-                            if created:
-                                prices_added += 1
+                    closes = PortfolioEngineV3._daily_values(hist['Close'])
+                    prices_added += PortfolioEngineV3._upsert_daily(PriceHistory, 'close_price', ticker, closes)
                                 
             except Exception as e:
                 print(f"[PortfolioEngineV3] Error updating {ticker}: {e}")
         
         # Update CASH prices
-        last_cash = PriceHistory.objects.filter(ticker='CASH').order_by('-date').first()
-        start_cash = (last_cash.date + timedelta(days=1)) if last_cash else trades.order_by('date').first().date.date()
-        
-        current_date = start_cash
-        while current_date <= today:
-            PriceHistory.objects.update_or_create(
-                ticker='CASH',
-                date=current_date,
-                defaults={'close_price': Decimal('1.0')}
-            )
-            current_date += timedelta(days=1)
+        last_cash = last_dates.get('CASH')
+        start_cash = (last_cash + timedelta(days=1)) if last_cash else first_trade_date
+        
+        PortfolioEngineV3._fill_cash_prices(start_cash, today)
+        
+        if prices_added:
+            PortfolioEngineV3.invalidate_cache(portfolio)
         
         return {'status': 'success', 'prices_added': prices_added}
     
     @staticmethod
-    def populate_dividend_history(portfolio):
+    def populate_dividend_history(portfolio, histories=None):
         """
         Fetch dividends from yfinance for all tickers during holding periods.
+        histories: result of _fetch_full_histories() to reuse instead of fetching again.
         """
-        from .models import Trade, DividendHistory
-        
-        trades = Trade.objects.filter(portfolio=portfolio)
-        if not trades.exists():
+        trades = PortfolioEngineV3._trades(portfolio)
+        if not trades:
             return {'status': 'no_trades'}
         
-        tickers = list(trades.values_list('ticker', flat=True).distinct())
-        first_trade_date = trades.order_by('date').first().date.date()
-        today = date.today()
-        
         dividends_added = 0
         
-        for ticker in tickers:
+        if histories is None:
+            histories = PortfolioEngineV3._fetch_full_histories(portfolio)
+        for ticker, hist, error in histories:
+            if error:
+                print(f"[PortfolioEngineV3] Error fetching dividends for {ticker}: {error}")
+                continue
+            
             try:
-                t = yf.Ticker(ticker)
-                hist = t.history(start=first_trade_date.isoformat(), end=(today + timedelta(days=1)).isoformat(), actions=True)
-                
                 if not hist.empty and 'Dividends' in hist.columns:
-                    hist.index = pd.to_datetime(hist.index).date
-                    
-                    for d, row in hist.iterrows():
-                        div_amount = row.get('Dividends', 0)
-                        if div_amount and div_amount > 0:
-                            _, created = DividendHistory.objects.update_or_create(
-                                ticker=ticker,
-                                date=d,
-                                defaults={'amount': Decimal(str(div_amount))}
-                            )
-                            if created:
-                                dividends_added += 1
+                    divs = hist['Dividends']
+                    amounts = PortfolioEngineV3._daily_values(divs[divs > 0])
+                    dividends_added += PortfolioEngineV3._upsert_daily(DividendHistory, 'amount', ticker, amounts)
                                 
             except Exception as e:
                 print(f"[PortfolioEngineV3] Error fetching dividends for {ticker}: {e}")
@@ -178,24 +320,35 @@ class PortfolioEngineV3:
         return {'status': 'success', 'dividends_added': dividends_added}
     
     @staticmethod
-    def build_transaction_log(portfolio):
+    def build_transaction_log(portfolio, transactions=None):
         """
         Combine Trade, CashTransaction, and DividendHistory into TransactionLog.
         Clears existing TransactionLog for this portfolio and rebuilds.
+        transactions: unsaved entries from _transaction_log_entries() to write instead of building them here.
         """
-        from .models import Trade, CashTransaction, DividendHistory, TransactionLog
+        if transactions is None:
+            transactions = PortfolioEngineV3._transaction_log_entries(portfolio)
         
-        # Clear existing transaction log for this portfolio
-        TransactionLog.objects.filter(portfolio=portfolio).delete()
+        # Swap the old log for the new one in one transaction, so readers never see it empty
+        with transaction.atomic():
+            TransactionLog.objects.filter(portfolio=portfolio).delete()
+            TransactionLog.objects.bulk_create(transactions, batch_size=1000)
+        PortfolioEngineV3.invalidate_cache(portfolio)
         
+        return {'status': 'success', 'transactions_created': len(transactions)}
+    
+    @staticmethod
+    def _transaction_log_entries(portfolio):
+        """Unsaved TransactionLog entries for the portfolio's trades, cash transactions and dividends."""
         transactions = []
+        trades_list = PortfolioEngineV3._trades(portfolio)
         
         # Add trades
-        for trade in Trade.objects.filter(portfolio=portfolio):
+        for trade in trades_list:
             trade_value = trade.quantity * trade.price
             
             if trade.side == 'BUY':
-                amount = -trade_value - trade.fees  # Cash decreases
+                amount = -abs(trade_value + trade.fees)  # Cash decreases
             else:  # SELL
                 amount = trade_value - trade.fees  # Cash increases
             
@@ -213,11 +366,11 @@ class PortfolioEngineV3:
             ))
         
         # Add cash transactions
-        for cash_txn in CashTransaction.objects.filter(portfolio=portfolio):
+        for cash_txn in portfolio.cash_transactions.all():
             if cash_txn.type == 'DEPOSIT':
                 amount = cash_txn.amount
-            else:  # WITHDRAWAL
-                amount = -cash_txn.amount
+            else:  # WITHDRAWAL (stored negative whichever sign it was entered with)
+                amount = -abs(cash_txn.amount)
             
             transactions.append(TransactionLog(
                 portfolio=portfolio,
@@ -233,18 +386,20 @@ class PortfolioEngineV3:
             ))
         
         # Add dividends (need to calculate shares held at each dividend date)
-        trades_list = list(Trade.objects.filter(portfolio=portfolio).order_by('date'))
-        tickers_traded = set(t.ticker for t in trades_list)
-        
-        for dividend in DividendHistory.objects.filter(ticker__in=tickers_traded):
+        # Per ticker: trade dates and running share count after each trade, for binary search
+        share_steps = defaultdict(lambda: ([], []))
+        for trade in trades_list:
+            dates, cum_shares = share_steps[trade.ticker]
+            held = cum_shares[-1] if cum_shares else Decimal('0')
+            dates.append(trade.date.date())
+            cum_shares.append(held + trade.quantity if trade.side == 'BUY' else held - trade.quantity)
+        
+        dividends = DividendHistory.objects.filter(ticker__in=share_steps).values_list('id', 'ticker', 'date', 'amount', named=True)
+        for dividend in dividends:
             # Calculate shares held on this date
-            shares_held = Decimal('0')
-            for trade in trades_list:
-                if trade.ticker == dividend.ticker and trade.date.date() <= dividend.date:
-                    if trade.side == 'BUY':
-                        shares_held += trade.quantity
-                    else:
-                        shares_held -= trade.quantity
+            dates, cum_shares = share_steps[dividend.ticker]
+            idx = bisect_right(dates, dividend.date)
+            shares_held = cum_shares[idx - 1] if idx else Decimal('0')
             
             if shares_held > 0:
                 div_amount = shares_held * dividend.amount
@@ -262,151 +417,196 @@ class PortfolioEngineV3:
                     source_type='dividend'
                 ))
         
-        # Bulk create
-        TransactionLog.objects.bulk_create(transactions)
+        # Round to the fields' decimal places now, so in-memory entries match the stored rows
+        for field in ('shares', 'price', 'amount', 'commission'):
+            exponent = Decimal(1).scaleb(-TransactionLog._meta.get_field(field).decimal_places)
+            for txn in transactions:
+                value = getattr(txn, field)
+                if value is not None:
+                    setattr(txn, field, value.quantize(exponent))
         
-        return {'status': 'success', 'transactions_created': len(transactions)}
+        return transactions
+    
+    @staticmethod
+    def _ledger_balances(portfolio):
+        """
+        Current (cash, {ticker: shares}) from the transaction log, summed by the database
+        instead of replaying every transaction in Python. Tickers with no net shares are included.
+        Sums are rounded back to the fields' decimal places, since SQLite adds them as floats.
+        """
+        traded = Q(ticker__gt='')  # excludes NULL and blank tickers
+        cash_rows = TransactionLog.objects.filter(
+            Q(type__in=('DEPOSIT', 'WITHDRAWAL', 'DIVIDEND')) | traded & Q(type__in=('BUY', 'SELL')),
+            portfolio=portfolio,
+        )
+        
+        # Amounts are signed cash impacts, so cash is their plain sum
+        cash = cash_rows.aggregate(cash=Sum('amount'))['cash'] or Decimal('0')
+        
+        return cash.quantize(Decimal('0.01')), PortfolioEngineV3._net_shares(portfolio)
+    
+    @staticmethod
+    def _net_shares(portfolio):
+        """{ticker: net shares} over all BUY/SELL rows, as one SUM ... GROUP BY ticker (see _ledger_balances)."""
+        net_shares = TransactionLog.objects.filter(
+            portfolio=portfolio, type__in=('BUY', 'SELL'), ticker__gt=''
+        ).order_by().values('ticker').annotate(
+            net=Sum(Case(When(type='BUY', then=F('shares')), default=-F('shares'), output_field=DecimalField()))
+        )
+        return {ticker: net.quantize(Decimal('0.0001')) for ticker, net in net_shares.values_list('ticker', 'net')}
+    
+    @staticmethod
+    def _latest_closes(tickers, as_of=None):
+        """{ticker: latest close_price} (on or before as_of, if given) in two queries instead of one per ticker."""
+        prices = PriceHistory.objects.filter(ticker__in=tickers)
+        if as_of is not None:
+            prices = prices.filter(date__lte=as_of)
+        
+        last_dates = dict(prices.order_by().values('ticker').annotate(last=Max('date')).values_list('ticker', 'last'))
+        if not last_dates:
+            return {}
+        return {
+            ticker: close_price
+            for ticker, price_date, close_price in prices.filter(date__in=set(last_dates.values()))
+            .values_list('ticker', 'date', 'close_price')
+            if last_dates[ticker] == price_date
+        }
     
     @staticmethod
-    def calculate_nav(portfolio):
+    def _decimal(value, places):
+        """Float -> Decimal rounded to a model field's decimal places ('-0.00' becomes '0.00')."""
+        return Decimal(f'{value:.{places}f}') + 0
+    
+    @staticmethod
+    def calculate_nav(portfolio, transactions=None):
         """
-        Main NAV calculation loop using unitization method.
+        Main NAV calculation using the unitization method, vectorized over days with NumPy.
+        Holdings are running sums of per-day share deltas marked against forward-filled closes;
+        units only change on deposit/withdrawal days, so NAV in between is value / constant units.
+        transactions: date-ordered (date, type, ticker, shares, amount) rows, if the caller has them.
         """
-        from .models import TransactionLog, PriceHistory, DailySnapshot
+        import numpy as np
         
         # Get all transactions sorted by date
-        transactions = list(TransactionLog.objects.filter(portfolio=portfolio).order_by('date'))
+        if transactions is None:
+            transactions = list(
+                TransactionLog.objects.filter(portfolio=portfolio).order_by('date')
+                .values_list('date', 'type', 'ticker', 'shares', 'amount')
+            )
         
         if not transactions:
             return {'status': 'no_transactions', 'message': 'No transactions found. Build transaction log first.'}
         
-        # Clear existing snapshots
-        DailySnapshot.objects.filter(portfolio=portfolio).delete()
-        
         # Find date range
-        first_date = transactions[0].date.date()
+        first_date = transactions[0][0].date()
         today = date.today()
-        
-        # Initialize
-        total_units = Decimal('0')
-        current_nav = Decimal('100.0')
-        
-        # Holdings ledger: {ticker: shares}
-        holdings = {'CASH': Decimal('0')}
-        
-        # Group transactions by date
-        txn_by_date = {}
-        for txn in transactions:
-            txn_date = txn.date.date()
-            if txn_date not in txn_by_date:
-                txn_by_date[txn_date] = []
-            txn_by_date[txn_date].append(txn)
-        
-        # Build price lookup
-        prices_qs = PriceHistory.objects.filter(date__gte=first_date, date__lte=today)
-        price_lookup = {}
-        for p in prices_qs:
-            if p.ticker not in price_lookup:
-                price_lookup[p.ticker] = {}
-            price_lookup[p.ticker][p.date] = p.close_price
-        
-        snapshots = []
-        current_date = first_date
-        
-        while current_date <= today:
-            day_transactions = txn_by_date.get(current_date, [])
-            
-            # Separate by type for processing order
-            dividends = [t for t in day_transactions if t.type == 'DIVIDEND']
-            trades = [t for t in day_transactions if t.type in ('BUY', 'SELL')]
-            external_flows = [t for t in day_transactions if t.type in ('DEPOSIT', 'WITHDRAWAL')]
-            
-            # Step 1: Process Dividends
-            for div in dividends:
-                holdings['CASH'] += div.amount
-            
-            # Step 2: Process Trades
-            for trade in trades:
-                ticker = trade.ticker
-                if ticker not in holdings:
-                    holdings[ticker] = Decimal('0')
-                
-                if trade.type == 'BUY':
-                    holdings['CASH'] -= abs(trade.amount)
-                    holdings[ticker] += trade.shares
-                else:  # SELL
-                    holdings['CASH'] += trade.amount
-                    holdings[ticker] -= trade.shares
-            
-            # Step 3: Mark-to-Market
-            total_value = Decimal('0')
-            for ticker, shares in holdings.items():
-                if shares == 0:
-                    continue
-                
-                if ticker == 'CASH':
-                    total_value += shares
-                else:
-                    price = Decimal('0')
-                    if ticker in price_lookup:
-                        if current_date in price_lookup[ticker]:
-                            price = price_lookup[ticker][current_date]
-                        else:
-                            for d in sorted(price_lookup[ticker].keys(), reverse=True):
-                                if d <= current_date:
-                                    price = price_lookup[ticker][d]
-                                    break
-                    
-                    total_value += shares * price
-            
-            # Step 4: Calculate NAV
-            if total_units > 0:
-                current_nav = total_value / total_units
-            
-            # Step 5: Process External Flows
-            for flow in external_flows:
-                if flow.type == 'DEPOSIT':
-                    if current_nav > 0:
-                        new_units = flow.amount / current_nav
-                    else:
-                        current_nav = Decimal('100.0')
-                        new_units = flow.amount / current_nav
-                    
-                    total_units += new_units
-                    holdings['CASH'] += flow.amount
-                    total_value += flow.amount
-                    
-                elif flow.type == 'WITHDRAWAL':
-                    if current_nav > 0:
-                        units_redeemed = abs(flow.amount) / current_nav
-                        total_units -= units_redeemed
-                    
-                    holdings['CASH'] -= abs(flow.amount)
-                    total_value -= abs(flow.amount)
+        n_days = max((today - first_date).days + 1, 0)
+        
+        columns = {}                        # ticker -> column in the (days x tickers) matrices
+        for _, txn_type, ticker, _, _ in transactions:
+            if txn_type in ('BUY', 'SELL'):
+                columns.setdefault(ticker, len(columns))
+        
+        # Per-day deltas. Dividends and trades settle before mark-to-market; external flows after
+        share_deltas = np.zeros((n_days, len(columns)))
+        cash_deltas = np.zeros(n_days)
+        flows = defaultdict(list)           # day -> [(type, amount)]
+        for txn_date, txn_type, ticker, shares, amount in transactions:
+            day = (txn_date.date() - first_date).days
+            if day >= n_days:
+                continue
             
-            # Step 6: Store Daily Snapshot
+            # Amounts are signed cash impacts (BUY and WITHDRAWAL rows are negative)
+            if txn_type in ('DEPOSIT', 'WITHDRAWAL'):
+                flows[day].append((txn_type, float(amount)))
+                continue
+            cash_deltas[day] += float(amount)
+            if txn_type == 'BUY':
+                share_deltas[day, columns[ticker]] += float(shares)
+            elif txn_type == 'SELL':
+                share_deltas[day, columns[ticker]] -= float(shares)
+        
+        flow_cash = np.zeros(n_days)
+        for day, day_flows in flows.items():
+            flow_cash[day] = sum(amount for _, amount in day_flows)
+        
+        # Price matrix: latest close on or before each day, 0 before a ticker's first close
+        prices = np.full((n_days, len(columns)), np.nan)
+        prices_qs = PriceHistory.objects.filter(ticker__in=columns, date__gte=first_date, date__lte=today)
+        for ticker, price_date, close_price in prices_qs.values_list('ticker', 'date', 'close_price'):
+            prices[(price_date - first_date).days, columns[ticker]] = float(close_price)
+        last_row = np.where(np.isnan(prices), 0, np.arange(n_days)[:, None])
+        np.maximum.accumulate(last_row, axis=0, out=last_row)
+        prices = np.nan_to_num(prices[last_row, np.arange(len(columns))])
+        
+        # Mark-to-market before the day's external flows, and cash/value after them
+        holdings_value = (share_deltas.cumsum(axis=0) * prices).sum(axis=1)
+        cash_before_flows = cash_deltas.cumsum() + flow_cash.cumsum() - flow_cash
+        cash_balance = cash_before_flows + flow_cash
+        value_before_flows = holdings_value + cash_before_flows
+        total_value = value_before_flows + flow_cash
+        
+        # Units: walk only the flow days. Between them units are constant, and NAV carries the
+        # last value while there are no units (a deposit at NAV <= 0 restarts it at 100)
+        navs = np.empty(n_days)
+        units_after = np.empty(n_days)
+        total_units = 0.0
+        current_nav = 100.0
+        segment_start = 0
+        for day in sorted(flows) + [n_days]:
+            segment = slice(segment_start, min(day + 1, n_days))
             if total_units > 0:
-                snapshots.append(DailySnapshot(
-                    portfolio=portfolio,
-                    date=current_date,
-                    total_value=total_value,
-                    total_units=total_units,
-                    nav=current_nav,
-                    cash_balance=holdings['CASH']
-                ))
+                navs[segment] = value_before_flows[segment] / total_units
+                if segment.stop > segment.start:
+                    current_nav = navs[segment.stop - 1]
+            else:
+                navs[segment] = current_nav
+            units_after[segment] = total_units
             
-            current_date += timedelta(days=1)
+            if day == n_days:
+                break
+            for flow_type, amount in flows[day]:
+                if flow_type == 'DEPOSIT':
+                    if current_nav <= 0:
+                        current_nav = 100.0
+                    total_units += amount / current_nav
+                elif current_nav > 0:
+                    total_units += amount / current_nav  # withdrawals are negative
+            navs[day] = current_nav
+            units_after[day] = total_units
+            segment_start = day + 1
+        
+        # Daily snapshots for every day that ends with units outstanding
+        to_decimal = PortfolioEngineV3._decimal
+        stored = np.flatnonzero(units_after > 0)
+        snapshots = [
+            DailySnapshot(
+                portfolio=portfolio,
+                date=first_date + timedelta(days=day),
+                total_value=to_decimal(value, 2),
+                total_units=to_decimal(units, 6),
+                nav=to_decimal(nav, 4),
+                cash_balance=to_decimal(cash, 2),
+            )
+            for day, value, units, nav, cash in zip(
+                stored.tolist(), total_value[stored].tolist(), units_after[stored].tolist(),
+                navs[stored].tolist(), cash_balance[stored].tolist(),
+            )
+        ]
         
-        # Bulk create snapshots
-        DailySnapshot.objects.bulk_create(snapshots)
+        # Replace existing snapshots in one transaction, so charts never read a half-written series
+        with transaction.atomic():
+            DailySnapshot.objects.filter(portfolio=portfolio).delete()
+            DailySnapshot.objects.bulk_create(snapshots, batch_size=1000)
+        PortfolioEngineV3.invalidate_cache(portfolio)
         
         # Calculate overall return
         if snapshots:
-            first_nav = Decimal('100.0')
-            last_nav = snapshots[-1].nav
+            first_nav = 100.0
+            last_nav = float(navs[stored[-1]])
             total_return = ((last_nav - first_nav) / first_nav) * 100
         else:
-            total_return = Decimal('0')
+            total_return = 0.0
         
         return {
             'status': 'success',
@@ -414,126 +614,155 @@ class PortfolioEngineV3:
             'first_date': first_date.isoformat(),
             'last_date': today.isoformat(),
             'final_nav': float(current_nav) if snapshots else 100.0,
-            'total_return_pct': float(total_return)
+            'total_return_pct': total_return
         }
     
     @staticmethod
     def get_chart_data(portfolio):
         """Return NAV chart data for display."""
-        from .models import DailySnapshot
         
-        snapshots = DailySnapshot.objects.filter(portfolio=portfolio).order_by('date')
+        snapshots = DailySnapshot.objects.filter(portfolio=portfolio).order_by('date').values_list('date', 'nav')
         
         return [
-            [int(datetime.combine(s.date, datetime.min.time()).timestamp() * 1000), float(s.nav)]
-            for s in snapshots
+            [(snap_date.toordinal() - EPOCH_ORDINAL) * MS_PER_DAY, float(nav)]
+            for snap_date, nav in snapshots
         ]
     
     @staticmethod
     def get_weekly_chart_data(portfolio):
-        """Return weekly chart data with both NAV % performance and total value."""
-        from .models import DailySnapshot
+        """
+        Return weekly chart data with both NAV % performance and total value.
+        Memoized per latest snapshot date, so a new snapshot busts the cached series.
+        """
+        
+        last_date = DailySnapshot.objects.filter(portfolio=portfolio).order_by('-date').values_list('date', flat=True).first()
+        if last_date is None:
+            return {'nav_pct': [], 'value': []}
         
-        snapshots = list(DailySnapshot.objects.filter(portfolio=portfolio).order_by('date'))
+        key = PortfolioEngineV3.cache_key(portfolio, f'weekly_chart:{last_date.isoformat()}')
+        data = cache.get(key)
+        if data is None:
+            data = PortfolioEngineV3._build_weekly_chart_data(portfolio)
+            cache.set(key, data, CHART_CACHE_TIMEOUT)
+        return data
+    
+    @staticmethod
+    def _build_weekly_chart_data(portfolio):
+        """Sample DailySnapshots weekly into NAV % and total value series."""
+        
+        # (date, nav, total_value) only: served from the dsnap_chart_cover index on PostgreSQL
+        snapshots = list(
+            DailySnapshot.objects.filter(portfolio=portfolio).order_by('date').values_list('date', 'nav', 'total_value')
+        )
         
         if not snapshots:
             return {'nav_pct': [], 'value': []}
         
-        # Sample weekly (every 7th day)
+        # Sample weekly (every 7th day): binary-search the next date at least 7 days on,
+        # so only the sampled rows are visited
+        dates = [s[0] for s in snapshots]
         weekly_snapshots = []
-        last_date = None
-        for s in snapshots:
-            if last_date is None or (s.date - last_date).days >= 7:
-                weekly_snapshots.append(s)
-                last_date = s.date
+        i = 0
+        while i < len(snapshots):
+            weekly_snapshots.append(snapshots[i])
+            i = bisect_left(dates, dates[i] + timedelta(days=7), i + 1)
         
         # Always include the last snapshot
-        if snapshots[-1] not in weekly_snapshots:
+        if weekly_snapshots[-1] is not snapshots[-1]:
             weekly_snapshots.append(snapshots[-1])
         
         nav_pct_data = []
         value_data = []
         
-        for s in weekly_snapshots:
-            timestamp = int(datetime.combine(s.date, datetime.min.time()).timestamp() * 1000)
-            nav_pct = float(s.nav) - 100  # % change from baseline
+        for snap_date, nav, total_value in weekly_snapshots:
+            timestamp = (snap_date.toordinal() - EPOCH_ORDINAL) * MS_PER_DAY
+            nav_pct = float(nav) - 100  # % change from baseline
             nav_pct_data.append([timestamp, round(nav_pct, 2)])
-            value_data.append([timestamp, float(s.total_value)])
+            value_data.append([timestamp, float(total_value)])
         
         return {
             'nav_pct': nav_pct_data,
             'value': value_data
         }
     
+    @staticmethod
+    def get_dashboard(portfolio):
+        """
+        Everything the management page shows, in one call. The cached engine results come
+        from one cache round trip (cached_calls); the weekly chart and live summary are
+        memoized on their own keys.
+        """
+        data = PortfolioEngineV3.cached_calls(portfolio, [
+            'get_summary', 'get_yearly_performance', 'get_current_holdings', 'get_closed_positions',
+        ])
+        return {
+            'weekly_chart_data': PortfolioEngineV3.get_weekly_chart_data(portfolio),
+            'summary': data['get_summary'],
+            'live_summary': PortfolioEngineV3.get_live_summary(portfolio),
+            'yearly_performance': data['get_yearly_performance'],
+            'current_holdings': data['get_current_holdings'],
+            'closed_positions': data['get_closed_positions'],
+        }
+    
     @staticmethod
     def get_summary(portfolio):
         """Return summary metrics for display."""
-        from .models import DailySnapshot
         
-        snapshots = list(DailySnapshot.objects.filter(portfolio=portfolio).order_by('date'))
+        snapshots = DailySnapshot.objects.filter(portfolio=portfolio)
         
-        if not snapshots:
+        # Latest row plus first date and count, instead of loading the whole series
+        last = snapshots.order_by('-date').values_list('total_value', 'nav', 'total_units', 'cash_balance').first()
+        if last is None:
             return None
         
-        first = snapshots[0]
-        last = snapshots[-1]
+        total_value, nav, total_units, cash_balance = last
+        stats = snapshots.aggregate(inception_date=Min('date'), days_tracked=Count('id'))
         
-        total_return = ((last.nav - Decimal('100.0')) / Decimal('100.0')) * 100
+        total_return = ((nav - Decimal('100.0')) / Decimal('100.0')) * 100
         
         return {
-            'total_value': float(last.total_value),
-            'nav': float(last.nav),
-            'total_units': float(last.total_units),
-            'cash_balance': float(last.cash_balance),
+            'total_value': float(total_value),
+            'nav': float(nav),
+            'total_units': float(total_units),
+            'cash_balance': float(cash_balance),
             'total_return_pct': float(total_return),
-            'inception_date': first.date.isoformat(),
-            'days_tracked': len(snapshots)
+            'inception_date': stats['inception_date'].isoformat(),
+            'days_tracked': stats['days_tracked']
         }
     
     @staticmethod
     def get_yearly_performance(portfolio):
         """Calculate year-by-year performance from NAV snapshots."""
-        from .models import DailySnapshot, TransactionLog, PriceHistory
-        from collections import defaultdict
-        
-        snapshots = list(DailySnapshot.objects.filter(portfolio=portfolio).order_by('date'))
         
-        if not snapshots:
-            return []
+        snapshots = DailySnapshot.objects.filter(portfolio=portfolio).order_by('date').values_list(
+            'date', 'nav', 'total_value', 'cash_balance', 'total_units'
+        )
         
         today = date.today()
         current_year = today.year
         
-        # Group snapshots by year
-        by_year = defaultdict(list)
-        for s in snapshots:
-            by_year[s.date.year].append(s)
+        # Last snapshot of each year; the query is ordered by date, so years are inserted ascending
+        by_year = {}
+        for snap in snapshots:
+            by_year[snap[0].year] = snap
+        
+        if not by_year:
+            return []
         
         yearly_data = []
         prev_year_end_nav = Decimal('100.0')
         
-        for year in sorted(by_year.keys()):
-            year_snapshots = by_year[year]
-            first_snap = year_snapshots[0]
-            last_snap = year_snapshots[-1]
-            
+        for year, (_, last_nav, last_value, last_cash, last_units) in by_year.items():
             start_nav = prev_year_end_nav
+            end_nav, end_value, end_cash = last_nav, last_value, last_cash
             
             # For current year, calculate live NAV
             if year == current_year:
-                live_data = PortfolioEngineV3._calculate_live_nav(portfolio, last_snap)
+                live_data = PortfolioEngineV3._calculate_live_nav(portfolio, last_units)
                 if live_data:
                     end_nav = Decimal(str(live_data['nav']))
                     end_value = Decimal(str(live_data['total_value']))
                     end_cash = Decimal(str(live_data['cash_balance']))
-                else:
-                    end_nav = last_snap.nav
-                    end_value = last_snap.total_value
-                    end_cash = last_snap.cash_balance
-            else:
-                end_nav = last_snap.nav
-                end_value = last_snap.total_value
-                end_cash = last_snap.cash_balance
             
             # Calculate return for this year
             if start_nav > 0:
@@ -556,56 +785,33 @@ class PortfolioEngineV3:
         return yearly_data
     
     @staticmethod
-    def _calculate_live_nav(portfolio, last_snapshot):
-        """Calculate today's NAV using latest PriceHistory prices."""
-        from .models import TransactionLog, PriceHistory
+    def _calculate_live_nav(portfolio, total_units):
+        """Calculate today's NAV using latest PriceHistory prices and the last snapshot's units."""
         
-        today = date.today()
+        cash, shares = PortfolioEngineV3._ledger_balances(portfolio)
         
-        txns = TransactionLog.objects.filter(portfolio=portfolio).order_by('date')
-        
-        holdings = {'CASH': Decimal('0')}
-        
-        for t in txns:
-            if t.type == 'DEPOSIT':
-                holdings['CASH'] += t.amount
-            elif t.type == 'WITHDRAWAL':
-                holdings['CASH'] -= abs(t.amount)
-            elif t.type == 'DIVIDEND':
-                holdings['CASH'] += t.amount
-            elif t.type == 'BUY' and t.ticker:
-                holdings['CASH'] -= abs(t.amount)
-                if t.ticker not in holdings:
-                    holdings[t.ticker] = Decimal('0')
-                holdings[t.ticker] += t.shares
-            elif t.type == 'SELL' and t.ticker:
-                holdings['CASH'] += t.amount
-                if t.ticker not in holdings:
-                    holdings[t.ticker] = Decimal('0')
-                holdings[t.ticker] -= t.shares
-        
-        total_value = holdings.get('CASH', Decimal('0'))
+        total_value = float(cash)
         has_prices = False
         
-        for ticker, shares in holdings.items():
-            if ticker == 'CASH' or shares <= 0:
-                continue
-            
-            price_obj = PriceHistory.objects.filter(ticker=ticker).order_by('-date').first()
-            if price_obj:
-                total_value += shares * price_obj.close_price
+        held = {ticker: float(net) for ticker, net in shares.items() if net > 0}
+        latest_closes = PortfolioEngineV3._latest_closes(held)
+        
+        for ticker, ticker_shares in held.items():
+            close_price = latest_closes.get(ticker)
+            if close_price is not None:
+                total_value += ticker_shares * float(close_price)
                 has_prices = True
         
         if not has_prices:
             return None
         
-        total_units = last_snapshot.total_units if last_snapshot.total_units > 0 else Decimal('1')
+        total_units = float(total_units) if total_units > 0 else 1.0
         live_nav = total_value / total_units
         
         return {
-            'total_value': float(total_value),
-            'nav': float(live_nav),
-            'cash_balance': float(holdings.get('CASH', 0))
+            'total_value': total_value,
+            'nav': live_nav,
+            'cash_balance': float(cash)
         }
     
     @staticmethod
@@ -615,16 +821,22 @@ class PortfolioEngineV3:
         
         print(f"[PortfolioEngineV3] Starting full rebuild for {portfolio.name}")
         
-        results['prices'] = PortfolioEngineV3.populate_price_history(portfolio)
+        # One history request per ticker serves both prices and dividends
+        histories = PortfolioEngineV3._fetch_full_histories(portfolio)
+        
+        results['prices'] = PortfolioEngineV3.populate_price_history(portfolio, histories)
         print(f"[PortfolioEngineV3] Prices: {results['prices']}")
         
-        results['dividends'] = PortfolioEngineV3.populate_dividend_history(portfolio)
+        results['dividends'] = PortfolioEngineV3.populate_dividend_history(portfolio, histories)
         print(f"[PortfolioEngineV3] Dividends: {results['dividends']}")
         
-        results['transactions'] = PortfolioEngineV3.build_transaction_log(portfolio)
+        # Build the log once: it is written to the DB and fed to the NAV calculation directly
+        entries = PortfolioEngineV3._transaction_log_entries(portfolio)
+        results['transactions'] = PortfolioEngineV3.build_transaction_log(portfolio, entries)
         print(f"[PortfolioEngineV3] Transactions: {results['transactions']}")
         
-        results['nav'] = PortfolioEngineV3.calculate_nav(portfolio)
+        rows = sorted(((t.date, t.type, t.ticker, t.shares, t.amount) for t in entries), key=itemgetter(0))
+        results['nav'] = PortfolioEngineV3.calculate_nav(portfolio, rows)
         print(f"[PortfolioEngineV3] NAV: {results['nav']}")
         
         return results
@@ -632,35 +844,24 @@ class PortfolioEngineV3:
     @staticmethod
     def get_current_holdings(portfolio):
         """Calculate current holdings with unrealized P&L using FIFO cost basis."""
-        from .models import TransactionLog, PriceHistory, LiveQuote
-        
-        txns = TransactionLog.objects.filter(portfolio=portfolio).order_by('date')
-        
-        # Track lots for FIFO cost basis
-        lots = {}
         
-        for t in txns:
-            if t.type == 'BUY' and t.ticker:
-                if t.ticker not in lots:
-                    lots[t.ticker] = []
-                cost_per_share = abs(float(t.amount)) / float(t.shares) if t.shares else 0
-                lots[t.ticker].append([float(t.shares), cost_per_share])
-            elif t.type == 'SELL' and t.ticker:
-                if t.ticker in lots:
-                    shares_to_sell = float(t.shares)
-                    while shares_to_sell > 0 and lots[t.ticker]:
-                        lot = lots[t.ticker][0]
-                        if lot[0] <= shares_to_sell:
-                            shares_to_sell -= lot[0]
-                            lots[t.ticker].pop(0)
-                        else:
-                            lot[0] -= shares_to_sell
-                            shares_to_sell = 0
+        lots, _ = PortfolioEngineV3._fifo_lots(portfolio)
         
         # Calculate current holdings
         holdings = []
         today = date.today()
         
+        # Prices for every ticker in two lookups, not one or two queries per ticker
+        market_open = PortfolioEngineV3.is_us_market_open()
+        live_quotes = {
+            ticker: float(price)
+            for ticker, price in LiveQuote.objects.filter(ticker__in=lots).values_list('ticker', 'price')
+        }
+        latest_closes = {
+            ticker: float(close_price)
+            for ticker, close_price in PortfolioEngineV3._latest_closes(lots, as_of=today).items()
+        }
+        
         for ticker, ticker_lots in lots.items():
             if not ticker_lots:
                 continue
@@ -672,24 +873,11 @@ class PortfolioEngineV3:
             total_cost = sum(lot[0] * lot[1] for lot in ticker_lots)
             avg_cost = total_cost / total_shares if total_shares else 0
             
-            # Get current price
-            current_price = 0
-            market_open = PortfolioEngineV3.is_us_market_open()
-            
+            # Get current price: live quote while the market is open, else the latest close
             if market_open:
-                live_quote = LiveQuote.objects.filter(ticker=ticker).first()
-                if live_quote:
-                    current_price = float(live_quote.price)
-                else:
-                    price_obj = PriceHistory.objects.filter(ticker=ticker, date__lte=today).order_by('-date').first()
-                    current_price = float(price_obj.close_price) if price_obj else 0
+                current_price = live_quotes.get(ticker, latest_closes.get(ticker, 0))
             else:
-                price_obj = PriceHistory.objects.filter(ticker=ticker, date__lte=today).order_by('-date').first()
-                if price_obj:
-                    current_price = float(price_obj.close_price)
-                else:
-                    live_quote = LiveQuote.objects.filter(ticker=ticker).first()
-                    current_price = float(live_quote.price) if live_quote else 0
+                current_price = latest_closes.get(ticker, live_quotes.get(ticker, 0))
             
             current_value = total_shares * current_price
             unrealized_pnl = current_value - total_cost
@@ -712,60 +900,98 @@ class PortfolioEngineV3:
             h['weight_pct'] = round((h['current_value'] / total_portfolio_value * 100) if total_portfolio_value else 0, 1)
         
         # Sort by current value descending
-        holdings.sort(key=lambda x: x['current_value'], reverse=True)
+        holdings.sort(key=itemgetter('current_value'), reverse=True)
         return holdings
     
     @staticmethod
-    def get_closed_positions(portfolio):
-        """Calculate closed positions with realized P&L using FIFO cost basis."""
-        from .models import TransactionLog
+    def get_current_holdings_summary(portfolio):
+        """
+        Current holdings without dollar values: ticker, weight, avg cost, price, P&L %.
+        Holdings come from FIFO lot replay in Python (not a table), so this projects the
+        cached get_current_holdings() result; its fields are already rounded.
+        """
+        return [{
+            'ticker': h['ticker'],
+            'weight_pct': h['weight_pct'],
+            'avg_cost': h['avg_cost'],
+            'current_price': h['current_price'],
+            'pnl_pct': h['unrealized_pnl_pct'],
+        } for h in PortfolioEngineV3.cached_call(portfolio, 'get_current_holdings')]
+    
+    @staticmethod
+    def _fifo_lots(portfolio):
+        """
+        FIFO replay of the portfolio's trades: (open lots {ticker: deque([shares, cost_per_share, buy_date])},
+        closed {ticker: realized totals}). Cached under cache_key(), which build_transaction_log() and
+        TransactionLogAdmin edits expire.
+        """
+        key = PortfolioEngineV3.cache_key(portfolio, 'fifo')
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        
+        trades = TransactionLog.objects.filter(
+            portfolio=portfolio, type__in=('BUY', 'SELL'), ticker__isnull=False
+        ).exclude(ticker='')
         
-        txns = TransactionLog.objects.filter(portfolio=portfolio).order_by('date')
+        # Convert Decimals to float once at the ORM boundary; rows are streamed, not loaded as one list
+        txns = trades.order_by('date').values_list('type', 'ticker', 'shares', 'amount', 'date').iterator(chunk_size=2000)
         
         lots = {}
         closed = {}
         
-        for t in txns:
-            if t.type == 'BUY' and t.ticker:
-                if t.ticker not in lots:
-                    lots[t.ticker] = []
-                cost_per_share = abs(float(t.amount)) / float(t.shares) if t.shares else 0
-                lots[t.ticker].append([float(t.shares), cost_per_share, t.date.date()])
-            elif t.type == 'SELL' and t.ticker:
-                if t.ticker not in lots:
+        for txn_type, ticker, shares, amount, txn_datetime in txns:
+            shares = float(shares)
+            txn_date = txn_datetime.date()
+            if txn_type == 'BUY':
+                if ticker not in lots:
+                    lots[ticker] = deque()
+                cost_per_share = -float(amount) / shares if shares else 0
+                lots[ticker].append([shares, cost_per_share, txn_date])
+            else:
+                if ticker not in lots:
                     continue
                     
-                shares_to_sell = float(t.shares)
-                proceeds_per_share = float(t.amount) / float(t.shares) if t.shares else 0
+                shares_to_sell = shares
+                proceeds_per_share = float(amount) / shares if shares else 0
                 
-                while shares_to_sell > 0 and lots[t.ticker]:
-                    lot = lots[t.ticker][0]
+                while shares_to_sell > 0 and lots[ticker]:
+                    lot = lots[ticker][0]
                     
-                    if t.ticker not in closed:
-                        closed[t.ticker] = {
+                    if ticker not in closed:
+                        closed[ticker] = {
                             'shares_sold': 0,
                             'total_proceeds': 0,
                             'total_cost': 0,
                             'first_buy': lot[2],
-                            'last_sell': t.date.date()
+                            'last_sell': txn_date
                         }
                     
                     if lot[0] <= shares_to_sell:
                         sold_shares = lot[0]
-                        closed[t.ticker]['shares_sold'] += sold_shares
-                        closed[t.ticker]['total_proceeds'] += sold_shares * proceeds_per_share
-                        closed[t.ticker]['total_cost'] += sold_shares * lot[1]
-                        closed[t.ticker]['last_sell'] = t.date.date()
+                        closed[ticker]['shares_sold'] += sold_shares
+                        closed[ticker]['total_proceeds'] += sold_shares * proceeds_per_share
+                        closed[ticker]['total_cost'] += sold_shares * lot[1]
+                        closed[ticker]['last_sell'] = txn_date
                         shares_to_sell -= sold_shares
-                        lots[t.ticker].pop(0)
+                        lots[ticker].popleft()
                     else:
-                        closed[t.ticker]['shares_sold'] += shares_to_sell
-                        closed[t.ticker]['total_proceeds'] += shares_to_sell * proceeds_per_share
-                        closed[t.ticker]['total_cost'] += shares_to_sell * lot[1]
-                        closed[t.ticker]['last_sell'] = t.date.date()
+                        closed[ticker]['shares_sold'] += shares_to_sell
+                        closed[ticker]['total_proceeds'] += shares_to_sell * proceeds_per_share
+                        closed[ticker]['total_cost'] += shares_to_sell * lot[1]
+                        closed[ticker]['last_sell'] = txn_date
                         lot[0] -= shares_to_sell
                         shares_to_sell = 0
         
+        cache.set(key, (lots, closed), CACHE_TIMEOUT)
+        return lots, closed
+    
+    @staticmethod
+    def get_closed_positions(portfolio):
+        """Calculate closed positions with realized P&L using FIFO cost basis."""
+        
+        lots, closed = PortfolioEngineV3._fifo_lots(portfolio)
+        
         result = []
         for ticker, data in closed.items():
             realized_pnl = data['total_proceeds'] - data['total_cost']
@@ -788,24 +1014,26 @@ class PortfolioEngineV3:
                 'fully_closed': is_fully_closed
             })
         
-        result.sort(key=lambda x: x['last_sell'], reverse=True)
+        result.sort(key=itemgetter('last_sell'), reverse=True)
         return result
     
     @staticmethod
     def is_us_market_open():
         """Check if US stock market is currently open (9:30 AM - 4:00 PM ET, Monday-Friday)."""
-        import pytz
-        
-        et = pytz.timezone('US/Eastern')
-        now_et = datetime.now(et)
-        
-        if now_et.weekday() > 4:
+        now_et = datetime.now(US_EASTERN)
+        return PortfolioEngineV3._is_market_open_at(now_et.replace(second=0, microsecond=0))
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _is_market_open_at(minute_et):
+        """Market-hours check for a whole minute (memoized: one evaluation per minute)."""
+        if minute_et.weekday() > 4:
             return False
         
-        market_open = now_et.replace(hour=9, minute=30, second=0, microsecond=0)
-        market_close = now_et.replace(hour=16, minute=0, second=0, microsecond=0)
+        market_open = minute_et.replace(hour=9, minute=30)
+        market_close = minute_et.replace(hour=16, minute=0)
         
-        return market_open <= now_et <= market_close
+        return market_open <= minute_et <= market_close
     
     @staticmethod
     def is_trading_day(check_date=None):
@@ -815,71 +1043,169 @@ class PortfolioEngineV3:
         return check_date.weekday() < 5
     
     @staticmethod
-    def update_live_quotes(portfolio):
-        """Fetch current prices from yfinance for tickers currently held in portfolio."""
-        from .models import LiveQuote, TransactionLog
-        
-        txns = TransactionLog.objects.filter(portfolio=portfolio).order_by('date')
+    def _held_tickers(portfolio):
+        """Tickers with a positive share balance in the portfolio's transaction log."""
         
-        holdings = {}
-        for t in txns:
-            if t.type == 'BUY' and t.ticker:
-                holdings[t.ticker] = holdings.get(t.ticker, Decimal('0')) + t.shares
-            elif t.type == 'SELL' and t.ticker:
-                holdings[t.ticker] = holdings.get(t.ticker, Decimal('0')) - t.shares
-        
-        current_tickers = [ticker for ticker, shares in holdings.items() if shares > 0]
+        return [ticker for ticker, shares in PortfolioEngineV3._net_shares(portfolio).items() if shares > 0]
+    
+    @staticmethod
+    def _download_closes(tickers, **download_kwargs):
+        """
+        Latest close per ticker from one yf.download() batch request: {ticker: Decimal}, skipping tickers without data.
+        Results are cached for QUOTES_CACHE_TIMEOUT, so overlapping refreshes share one download.
+        """
+        import yfinance as yf
+        
+        request = ' '.join(tickers) + '|' + ':'.join(f'{k}={v}' for k, v in sorted(download_kwargs.items()))
+        key = f'yf:closes:{hashlib.sha1(request.encode()).hexdigest()}'
+        closes = cache.get(key)
+        if closes is not None:
+            return closes
+        
+        data = yf.download(' '.join(tickers), progress=False, threads=True, **download_kwargs)
+        
+        closes = {}
+        if data.empty or 'Close' not in data.columns:
+            return closes
+        
+        close_data = data['Close']
+        if close_data.ndim == 1:  # flat columns for a single ticker
+            close_data = close_data.to_frame(tickers[0])
+        
+        # Last non-NaN close of every column in one pass, then plain floats
+        latest = close_data.ffill().iloc[-1].dropna()
+        requested = set(tickers)
+        closes = {
+            ticker: Decimal(str(price))
+            for ticker, price in zip(latest.index.tolist(), latest.tolist())
+            if ticker in requested
+        }
         
-        if not current_tickers:
-            return {'status': 'no_tickers', 'updated': 0}
+        if closes:
+            cache.set(key, closes, QUOTES_CACHE_TIMEOUT)
+        return closes
+    
+    @staticmethod
+    def _fetch_closes_per_ticker(tickers):
+        """
+        Fallback for _download_closes: one yf.Ticker(ticker).history(period='1d') request per ticker, run concurrently.
+        Yields (ticker, close, error); close is None when Yahoo returned no data.
+        """
+        import yfinance as yf
         
-        updated = 0
+        def fetch(ticker):
+            try:
+                hist = yf.Ticker(ticker).history(period='1d')
+            except Exception as e:
+                return ticker, None, e
+            if hist.empty or 'Close' not in hist.columns:
+                return ticker, None, None
+            closes = hist['Close'].dropna()
+            if closes.empty:
+                return ticker, None, None
+            return ticker, Decimal(str(float(closes.iloc[-1]))), None
+        
+        if not tickers:
+            return
+        with ThreadPoolExecutor(max_workers=min(8, len(tickers))) as pool:
+            yield from pool.map(fetch, tickers)
+    
+    @staticmethod
+    def _refresh_live_quotes(tickers):
+        """
+        Download latest prices for all tickers in one yfinance batch request and store them as LiveQuotes.
+        Tickers the batch missed (or all of them, if it failed) are retried one request per ticker.
+        """
+        prices = {}
         errors = []
         
         try:
-            tickers_str = ' '.join(current_tickers)
-            data = yf.download(tickers_str, period='1d', progress=False, threads=True)
-            
-            if not data.empty:
-                if len(current_tickers) == 1:
-                    ticker = current_tickers[0]
-                    if 'Close' in data.columns and not data['Close'].empty:
-                        price = float(data['Close'].iloc[-1])
-                        LiveQuote.objects.update_or_create(
-                            ticker=ticker,
-                            defaults={'price': Decimal(str(price))}
-                        )
-                        updated += 1
-                else:
-                    if 'Close' in data.columns:
-                        close_data = data['Close']
-                        for ticker in current_tickers:
-                            if ticker in close_data.columns:
-                                price_series = close_data[ticker].dropna()
-                                if not price_series.empty:
-                                    price = float(price_series.iloc[-1])
-                                    LiveQuote.objects.update_or_create(
-                                        ticker=ticker,
-                                        defaults={'price': Decimal(str(price))}
-                                    )
-                                    updated += 1
+            prices = PortfolioEngineV3._download_closes(tickers, period='1d')
         except Exception as e:
             errors.append(f"Batch download error: {str(e)}")
             print(f"[LiveQuote] Batch download error: {e}")
         
+        missing = [ticker for ticker in tickers if ticker not in prices]
+        prices = dict(prices)  # _download_closes results may be shared through the cache
+        for ticker, close, error in PortfolioEngineV3._fetch_closes_per_ticker(missing):
+            if error:
+                errors.append(f"{ticker}: {str(error)}")
+                print(f"[LiveQuote] Error fetching {ticker}: {error}")
+            elif close is not None:
+                prices[ticker] = close
+        
+        try:
+            PortfolioEngineV3._save_live_quotes(prices)
+        except Exception as e:
+            errors.append(f"Error saving live quotes: {str(e)}")
+            print(f"[LiveQuote] Error saving live quotes: {e}")
+            prices = {}
+        
         return {
             'status': 'success',
-            'updated': updated,
-            'total_tickers': len(current_tickers),
+            'updated': len(prices),
+            'total_tickers': len(tickers),
             'errors': errors
         }
     
+    @staticmethod
+    def _save_live_quotes(prices):
+        """Upsert {ticker: price} into LiveQuote with a single INSERT ... ON CONFLICT UPDATE."""
+        
+        LiveQuote.objects.bulk_create(
+            [LiveQuote(ticker=ticker, price=price) for ticker, price in prices.items()],
+            update_conflicts=True,
+            unique_fields=['ticker'],
+            update_fields=['price', 'updated_at'],  # auto_now is applied to inserted rows
+            batch_size=500,
+        )
+    
+    @staticmethod
+    def update_live_quotes(portfolio):
+        """Fetch current prices from yfinance for tickers currently held in portfolio."""
+        current_tickers = PortfolioEngineV3._held_tickers(portfolio)
+        
+        if not current_tickers:
+            return {'status': 'no_tickers', 'updated': 0}
+        
+        result = PortfolioEngineV3._refresh_live_quotes(current_tickers)
+        PortfolioEngineV3.invalidate_cache(portfolio)
+        return result
+    
+    @staticmethod
+    def update_live_quotes_bulk(portfolios):
+        """
+        Fetch current prices for the union of tickers held across portfolios.
+        Issues a single batch download instead of one per portfolio.
+        """
+        portfolios = list(portfolios)
+        current_tickers = set()
+        for portfolio in portfolios:
+            current_tickers.update(PortfolioEngineV3._held_tickers(portfolio))
+        
+        if not current_tickers:
+            return {'status': 'no_tickers', 'updated': 0}
+        
+        result = PortfolioEngineV3._refresh_live_quotes(sorted(current_tickers))
+        for portfolio in portfolios:
+            PortfolioEngineV3.invalidate_cache(portfolio)
+        return result
+    
     @staticmethod
     def get_live_summary(portfolio):
-        """Calculate today's tentative NAV using LiveQuote prices."""
-        from .models import DailySnapshot, TransactionLog, LiveQuote, PriceHistory
+        """
+        Calculate today's tentative NAV using LiveQuote prices.
+        Cached until the quotes, the portfolio's derived data or the date change, so repeat renders
+        between quote refreshes (and all of them while the market is closed) skip the recompute.
+        """
         
         today = date.today()
+        last_quote_update = LiveQuote.objects.aggregate(last=Max('updated_at'))['last']
+        quotes_version = last_quote_update.isoformat() if last_quote_update else 'none'
+        key = PortfolioEngineV3.cache_key(portfolio, f'live_summary:{today}:{quotes_version}')
+        summary = cache.get(key)
+        if summary is not None:
+            return {**summary, 'market_open': PortfolioEngineV3.is_us_market_open()}
         
         last_snapshot = DailySnapshot.objects.filter(
             portfolio=portfolio,
@@ -889,190 +1215,138 @@ class PortfolioEngineV3:
         if not last_snapshot:
             return None
         
-        live_quotes = {lq.ticker: lq.price for lq in LiveQuote.objects.all()}
+        live_quotes = dict(LiveQuote.objects.values_list('ticker', 'price'))
         
         if not live_quotes:
             return None
         
-        txns = TransactionLog.objects.filter(portfolio=portfolio).order_by('date')
-        
-        holdings = {'CASH': Decimal('0')}
-        
-        for t in txns:
-            if t.type == 'DEPOSIT':
-                holdings['CASH'] += t.amount
-            elif t.type == 'WITHDRAWAL':
-                holdings['CASH'] -= abs(t.amount)
-            elif t.type == 'DIVIDEND':
-                holdings['CASH'] += t.amount
-            elif t.type == 'BUY' and t.ticker:
-                holdings['CASH'] -= abs(t.amount)
-                if t.ticker not in holdings:
-                    holdings[t.ticker] = Decimal('0')
-                holdings[t.ticker] += t.shares
-            elif t.type == 'SELL' and t.ticker:
-                holdings['CASH'] += t.amount
-                if t.ticker not in holdings:
-                    holdings[t.ticker] = Decimal('0')
-                holdings[t.ticker] -= t.shares
-        
-        total_value = holdings.get('CASH', Decimal('0'))
-        
-        for ticker, shares in holdings.items():
-            if ticker == 'CASH' or shares <= 0:
-                continue
-            
-            if ticker in live_quotes:
-                total_value += shares * live_quotes[ticker]
-            else:
-                price_obj = PriceHistory.objects.filter(ticker=ticker).order_by('-date').first()
-                if price_obj:
-                    total_value += shares * price_obj.close_price
+        cash, holdings = PortfolioEngineV3._ledger_balances(portfolio)
+        
+        total_value = cash
+        
+        held = {ticker: shares for ticker, shares in holdings.items() if shares > 0}
+        # Latest close for holdings without a live quote, in one lookup
+        latest_closes = PortfolioEngineV3._latest_closes([ticker for ticker in held if ticker not in live_quotes])
+        
+        for ticker, shares in held.items():
+            price = live_quotes.get(ticker, latest_closes.get(ticker))
+            if price is not None:
+                total_value += shares * price
         
         total_units = last_snapshot.total_units
         live_nav = total_value / total_units if total_units > 0 else Decimal('100.0')
         total_return = ((live_nav - Decimal('100.0')) / Decimal('100.0')) * 100
         
-        most_recent_quote = LiveQuote.objects.order_by('-updated_at').first()
-        
-        return {
+        summary = {
             'total_value': float(total_value),
             'nav': float(live_nav),
             'total_units': float(total_units),
-            'cash_balance': float(holdings.get('CASH', 0)),
+            'cash_balance': float(cash),
             'total_return_pct': float(total_return),
             'is_live': True,
             'market_open': PortfolioEngineV3.is_us_market_open(),
-            'last_quote_update': most_recent_quote.updated_at if most_recent_quote else None,
+            'last_quote_update': last_quote_update,
             'prev_nav': float(last_snapshot.nav),
             'prev_value': float(last_snapshot.total_value),
             'day_change_pct': float((live_nav - last_snapshot.nav) / last_snapshot.nav * 100) if last_snapshot.nav > 0 else 0
         }
+        cache.set(key, summary, CACHE_TIMEOUT)
+        return summary
     
     @staticmethod
     def incremental_eod_update(portfolio):
         """Perform end-of-day update: add today's DailySnapshot using close prices."""
-        from .models import DailySnapshot, TransactionLog, PriceHistory
-        
         today = date.today()
         
         if not PortfolioEngineV3.is_trading_day(today):
             return {'status': 'not_trading_day', 'message': f'{today} is not a trading day'}
         
-        # Fetch today's close prices
-        trades = TransactionLog.objects.filter(portfolio=portfolio, ticker__isnull=False)
-        tickers = list(trades.values_list('ticker', flat=True).distinct())
+        # Fetch today's close prices in one batch request
+        trades = TransactionLog.objects.filter(portfolio=portfolio, ticker__isnull=False).exclude(ticker='')
+        tickers = list(trades.order_by().values_list('ticker', flat=True).distinct())
         
-        prices_updated = 0
-        for ticker in tickers:
+        closes = {}
+        if tickers:
             try:
-                t = yf.Ticker(ticker)
-                hist = t.history(period="1d", auto_adjust=False)
-                
-                if not hist.empty:
-                    close_price = Decimal(str(hist['Close'].iloc[-1]))
-                    PriceHistory.objects.update_or_create(
-                        ticker=ticker,
-                        date=today,
-                        defaults={'close_price': close_price}
-                    )
-                    prices_updated += 1
+                closes = PortfolioEngineV3._download_closes(tickers, period='1d', auto_adjust=False)
             except Exception as e:
-                print(f"[EOD Update] Error fetching {ticker}: {e}")
-        
-        # Add CASH price
-        PriceHistory.objects.update_or_create(
-            ticker='CASH',
-            date=today,
-            defaults={'close_price': Decimal('1.0')}
-        )
-        
-        # Get previous snapshot
-        prev_snapshot = DailySnapshot.objects.filter(
-            portfolio=portfolio,
-            date__lt=today
-        ).order_by('-date').first()
-        
-        if not prev_snapshot:
-            return {'status': 'no_previous_snapshot', 'message': 'No previous snapshot found. Run full rebuild first.'}
-        
-        # Calculate today's holdings and value
-        txns = list(TransactionLog.objects.filter(portfolio=portfolio).order_by('date'))
+                print(f"[EOD Update] Batch download error: {e}")
         
-        holdings = {'CASH': Decimal('0')}
-        total_units = Decimal('0')
+        prices_updated = len(closes)
         
-        for t in txns:
-            txn_date = t.date.date()
+        # All writes below commit together; on PostgreSQL the commit skips the synchronous WAL flush,
+        # since a lost EOD run is simply redone from the price history
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL synchronous_commit = off')
             
-            if t.type == 'DEPOSIT':
-                if total_units == 0:
-                    nav_at_deposit = Decimal('100.0')
-                else:
-                    snap = DailySnapshot.objects.filter(
-                        portfolio=portfolio,
-                        date__lt=txn_date
-                    ).order_by('-date').first()
-                    nav_at_deposit = snap.nav if snap else Decimal('100.0')
-                
-                new_units = t.amount / nav_at_deposit
-                total_units += new_units
-                holdings['CASH'] += t.amount
-                
-            elif t.type == 'WITHDRAWAL':
-                snap = DailySnapshot.objects.filter(
-                    portfolio=portfolio,
-                    date__lt=txn_date
-                ).order_by('-date').first()
-                nav_at_withdrawal = snap.nav if snap else Decimal('100.0')
-                
-                units_redeemed = abs(t.amount) / nav_at_withdrawal
-                total_units -= units_redeemed
-                holdings['CASH'] -= abs(t.amount)
-                
-            elif t.type == 'DIVIDEND':
-                holdings['CASH'] += t.amount
-                
-            elif t.type == 'BUY' and t.ticker:
-                holdings['CASH'] -= abs(t.amount)
-                if t.ticker not in holdings:
-                    holdings[t.ticker] = Decimal('0')
-                holdings[t.ticker] += t.shares
+            # Write the closes and today's CASH price in one upsert
+            closes['CASH'] = Decimal('1.0')
+            PriceHistory.objects.bulk_create(
+                [PriceHistory(ticker=ticker, date=today, close_price=close_price) for ticker, close_price in closes.items()],
+                update_conflicts=True,
+                unique_fields=['ticker', 'date'],
+                update_fields=['close_price'],
+            )
+            
+            # Get previous snapshot
+            prev_snapshot = DailySnapshot.objects.filter(
+                portfolio=portfolio,
+                date__lt=today
+            ).order_by('-date').first()
+            
+            if not prev_snapshot:
+                return {'status': 'no_previous_snapshot', 'message': 'No previous snapshot found. Run full rebuild first.'}
+            
+            # Calculate today's holdings and value: balances are summed by the database. Units carry
+            # over from the previous snapshot; only external flows booked after it are replayed,
+            # all at that snapshot's NAV (the last one before them)
+            cash, holdings = PortfolioEngineV3._ledger_balances(portfolio)
+            flows = TransactionLog.objects.filter(
+                portfolio=portfolio, type__in=('DEPOSIT', 'WITHDRAWAL'), date__date__gt=prev_snapshot.date
+            ).order_by('date').values_list('type', 'amount').iterator(chunk_size=2000)
+            
+            total_units = prev_snapshot.total_units
+            
+            for txn_type, amount in flows:
+                if txn_type == 'DEPOSIT':
+                    if total_units == 0:
+                        nav_at_deposit = Decimal('100.0')
+                    else:
+                        nav_at_deposit = prev_snapshot.nav
+                    
+                    new_units = amount / nav_at_deposit
+                    total_units += new_units
                 
-            elif t.type == 'SELL' and t.ticker:
-                holdings['CASH'] += t.amount
-                if t.ticker not in holdings:
-                    holdings[t.ticker] = Decimal('0')
-                holdings[t.ticker] -= t.shares
-        
-        # Mark-to-market
-        total_value = holdings.get('CASH', Decimal('0'))
-        
-        for ticker, shares in holdings.items():
-            if ticker == 'CASH' or shares <= 0:
-                continue
+                elif txn_type == 'WITHDRAWAL':
+                    units_redeemed = -amount / prev_snapshot.nav
+                    total_units -= units_redeemed
             
-            price_obj = PriceHistory.objects.filter(ticker=ticker, date=today).first()
-            if not price_obj:
-                price_obj = PriceHistory.objects.filter(ticker=ticker, date__lt=today).order_by('-date').first()
+            # Mark-to-market
+            total_value = cash
             
-            if price_obj:
-                total_value += shares * price_obj.close_price
-        
-        # Calculate NAV
-        nav = total_value / total_units if total_units > 0 else Decimal('100.0')
-        
-        # Create or update today's snapshot
-        snapshot, created = DailySnapshot.objects.update_or_create(
-            portfolio=portfolio,
-            date=today,
-            defaults={
-                'total_value': total_value,
-                'total_units': total_units,
-                'nav': nav,
-                'cash_balance': holdings.get('CASH', Decimal('0'))
-            }
-        )
+            held = {ticker: shares for ticker, shares in holdings.items() if shares > 0}
+            prices = PortfolioEngineV3._latest_closes(held, as_of=today)
+            for ticker, shares in held.items():
+                if ticker in prices:
+                    total_value += shares * prices[ticker]
+            
+            # Calculate NAV
+            nav = total_value / total_units if total_units > 0 else Decimal('100.0')
+            
+            # Create or update today's snapshot
+            snapshot, created = DailySnapshot.objects.update_or_create(
+                portfolio=portfolio,
+                date=today,
+                defaults={
+                    'total_value': total_value,
+                    'total_units': total_units,
+                    'nav': nav,
+                    'cash_balance': cash
+                }
+            )
+        PortfolioEngineV3.invalidate_cache(portfolio)
         
         total_return = ((nav - Decimal('100.0')) / Decimal('100.0')) * 100
         
@@ -0,0 +1,26 @@
+"""
+Signal handlers for dpk-data.
+Keep cached Portfolio lookups (API slug map, admin filter choices) and the fintest
+questions payload in sync with the DB.
+"""
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import FintestQuestion, Portfolio
+
+
+@receiver([post_save, post_delete], sender=Portfolio)
+def clear_portfolio_caches(sender, instance, **kwargs):
+    from .admin import PORTFOLIO_CHOICES_CACHE_KEY
+    from .api_views import clear_portfolio_cache
+    
+    cache.delete(PORTFOLIO_CHOICES_CACHE_KEY)
+    clear_portfolio_cache()
+
+
+@receiver([post_save, post_delete], sender=FintestQuestion)
+def clear_fintest_caches(sender, instance, **kwargs):
+    from .views import clear_fintest_questions_cache
+    
+    clear_fintest_questions_cache()
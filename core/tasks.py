@@ -0,0 +1,41 @@
+"""
+Background tasks for dpk-data.
+
+run_per_portfolio() fans per-portfolio engine calls (EOD update, live quotes,
+full rebuilds) out over threads for callers that wait for the results.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def run_per_portfolio(portfolios, func, max_workers=8):
+    """
+    Run func(portfolio) for each portfolio in a thread pool.
+    Engine calls are dominated by market-data network I/O, so running them
+    side by side makes the total time ~max instead of the sum.
+    Yields (portfolio, result, error) in completion order; exactly one of
+    result/error is set.
+    """
+    portfolios = list(portfolios)
+    if not portfolios:
+        return
+    
+    def worker(portfolio):
+        try:
+            return func(portfolio), None
+        except Exception as e:
+            # Callers only report str(e), so keep the traceback in the log
+            logger.exception(f"[Tasks] Error running {func.__name__} for portfolio {portfolio.id}")
+            return None, e
+        finally:
+            # Each worker thread opens its own DB connection
+            connection.close()
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(portfolios))) as pool:
+        futures = {pool.submit(worker, p): p for p in portfolios}
+        for future in as_completed(futures):
+            result, error = future.result()
+            yield futures[future], result, error
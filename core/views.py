@@ -2,13 +2,32 @@
 Views for dpk-data: index, portfolio, and settings.
 All views require staff/admin login.
 """
+import hashlib
 import json
+import logging
+import time
+from datetime import date
 from django.shortcuts import render, get_object_or_404
+from django.core.cache import cache
 from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
 from django.views.decorators.clickjacking import xframe_options_exempt
+from django.views.decorators.http import etag
 from django.contrib.admin.views.decorators import staff_member_required
 from decimal import Decimal
 
+from .api_views import dumps, get_portfolio
+from .models import FintestQuestion, FintestResult, Portfolio, PriceHistory, SiteSettings
+from .services import CACHE_TIMEOUT, SHARED_CACHE, PortfolioEngineV3
+
+logger = logging.getLogger(__name__)
+
+
+def _chart_json(data):
+    """Chart series encoded with orjson for inline <script> use in templates (rendered with |safe)."""
+    return dumps(data).decode()
+
 
 @staff_member_required
 def index(request):
@@ -26,11 +45,8 @@ def portfolio_public(request):
     Public portfolio view - read-only, no login required.
     Shows the ACTIVE portfolio performance data for public viewing.
     """
-    from .models import Portfolio
-    from .services import PortfolioEngineV3
-    
     # Always show the active portfolio (ID=2)
-    portfolio = Portfolio.objects.filter(id=2).first()
+    portfolio = get_portfolio('active')
     
     context = {
         'portfolio': portfolio,
@@ -43,64 +59,88 @@ def portfolio_public(request):
     
     if portfolio:
         context['weekly_chart_data'] = PortfolioEngineV3.get_weekly_chart_data(portfolio)
-        context['summary'] = PortfolioEngineV3.get_summary(portfolio)
-        context['yearly_performance'] = PortfolioEngineV3.get_yearly_performance(portfolio)
-        context['current_holdings'] = PortfolioEngineV3.get_current_holdings(portfolio)
-        context['closed_positions'] = PortfolioEngineV3.get_closed_positions(portfolio)
+        data = PortfolioEngineV3.cached_calls(portfolio, [
+            'get_summary', 'get_yearly_performance', 'get_current_holdings', 'get_closed_positions',
+        ])
+        context['summary'] = data['get_summary']
+        context['yearly_performance'] = data['get_yearly_performance']
+        context['current_holdings'] = data['get_current_holdings']
+        context['closed_positions'] = data['get_closed_positions']
     
+    context['weekly_chart_data'] = _chart_json(context['weekly_chart_data'])
     return render(request, 'core/portfolio_public.html', context)
 
 
+def _embed_etag(request):
+    """
+    ETag for the chart embeds: a hash of the weekly series they render (memoized by
+    get_weekly_chart_data()), so unchanged embeds are answered with 304 Not Modified.
+    """
+    portfolio = get_portfolio('active')
+    if not portfolio:
+        return None
+    return _data_etag(request.path, PortfolioEngineV3.get_weekly_chart_data(portfolio))
+
+
+def _holdings_embed_etag(request):
+    """ETag for the holdings embed: a hash of the cached holdings list it renders."""
+    portfolio = get_portfolio('active')
+    if not portfolio:
+        return None
+    return _data_etag(request.path, PortfolioEngineV3.cached_call(portfolio, 'get_current_holdings'))
+
+
+def _data_etag(path, data):
+    """Quoted MD5 of a view's path and the data it renders."""
+    return '"%s"' % hashlib.md5(path.encode() + dumps(data)).hexdigest()
+
+
 @staff_member_required
 @xframe_options_exempt
+@etag(_embed_etag)
+@cache_control(private=True, max_age=300)
 def portfolio_chart_embed(request):
     """Embeddable chart-only view for iframe use on external sites (e.g. WordPress)."""
-    from .models import Portfolio
-    from .services import PortfolioEngineV3
-
-    portfolio = Portfolio.objects.filter(id=2).first()
+    portfolio = get_portfolio('active')
     weekly_chart_data = PortfolioEngineV3.get_weekly_chart_data(portfolio) if portfolio else {'nav_pct': [], 'value': []}
 
     return render(request, 'core/portfolio_embed.html', {
-        'weekly_chart_data': weekly_chart_data,
+        'weekly_chart_data': _chart_json(weekly_chart_data),
     })
 
 
 @staff_member_required
 @xframe_options_exempt
+@etag(_embed_etag)
+@cache_control(private=True, max_age=300)
 def embed_return_chart(request):
     """Embeddable return % chart only."""
-    from .models import Portfolio
-    from .services import PortfolioEngineV3
-
-    portfolio = Portfolio.objects.filter(id=2).first()
+    portfolio = get_portfolio('active')
     chart_data = PortfolioEngineV3.get_weekly_chart_data(portfolio)['nav_pct'] if portfolio else []
 
-    return render(request, 'core/embed_return.html', {'chart_data': chart_data})
+    return render(request, 'core/embed_return.html', {'chart_data': _chart_json(chart_data)})
 
 
 @staff_member_required
 @xframe_options_exempt
+@etag(_embed_etag)
+@cache_control(private=True, max_age=300)
 def embed_value_chart(request):
     """Embeddable portfolio value chart only."""
-    from .models import Portfolio
-    from .services import PortfolioEngineV3
-
-    portfolio = Portfolio.objects.filter(id=2).first()
+    portfolio = get_portfolio('active')
     chart_data = PortfolioEngineV3.get_weekly_chart_data(portfolio)['value'] if portfolio else []
 
-    return render(request, 'core/embed_value.html', {'chart_data': chart_data})
+    return render(request, 'core/embed_value.html', {'chart_data': _chart_json(chart_data)})
 
 
 @staff_member_required
 @xframe_options_exempt
+@etag(_holdings_embed_etag)
+@cache_control(private=True, max_age=300)
 def embed_holdings(request):
     """Embeddable current holdings table."""
-    from .models import Portfolio
-    from .services import PortfolioEngineV3
-
-    portfolio = Portfolio.objects.filter(id=2).first()
-    current_holdings = PortfolioEngineV3.get_current_holdings(portfolio) if portfolio else []
+    portfolio = get_portfolio('active')
+    current_holdings = PortfolioEngineV3.cached_call(portfolio, 'get_current_holdings') if portfolio else []
 
     return render(request, 'core/embed_holdings.html', {'current_holdings': current_holdings})
 
@@ -108,9 +148,6 @@ def embed_holdings(request):
 @staff_member_required
 def lab_portfolio_v3(request):
     """Portfolio Tracker v3 - NAV/Unitization Engine (full management view)."""
-    from .models import Portfolio
-    from .services import PortfolioEngineV3
-    
     portfolios = Portfolio.objects.all()
     selected_portfolio_id = request.GET.get('portfolio_id')
     rebuild = request.GET.get('rebuild') == 'true'
@@ -124,7 +161,6 @@ def lab_portfolio_v3(request):
     context = {
         'portfolios': portfolios,
         'selected_portfolio': portfolio,
-        'chart_data': [],
         'weekly_chart_data': {'nav_pct': [], 'value': []},
         'summary': None,
         'live_summary': None,
@@ -146,14 +182,9 @@ def lab_portfolio_v3(request):
             PortfolioEngineV3.update_price_history(portfolio)
         
         # Get chart data and summary
-        context['chart_data'] = PortfolioEngineV3.get_chart_data(portfolio)
-        context['weekly_chart_data'] = PortfolioEngineV3.get_weekly_chart_data(portfolio)
-        context['summary'] = PortfolioEngineV3.get_summary(portfolio)
-        context['live_summary'] = PortfolioEngineV3.get_live_summary(portfolio)
-        context['yearly_performance'] = PortfolioEngineV3.get_yearly_performance(portfolio)
-        context['current_holdings'] = PortfolioEngineV3.get_current_holdings(portfolio)
-        context['closed_positions'] = PortfolioEngineV3.get_closed_positions(portfolio)
+        context.update(PortfolioEngineV3.get_dashboard(portfolio))
     
+    context['weekly_chart_data'] = {name: _chart_json(series) for name, series in context['weekly_chart_data'].items()}
     return render(request, 'core/lab_portfolio_v3.html', context)
 
 
@@ -164,16 +195,13 @@ def lab_portfolio_v3(request):
 @staff_member_required
 def lab_settings(request):
     """Settings page for managing site configuration."""
-    from .models import SiteSettings, PriceHistory
-    from django.utils import timezone
-    
     settings = SiteSettings.get_settings()
     
     if request.method == 'POST':
         # Handle settings update
         settings.live_quotes_enabled = request.POST.get('live_quotes_enabled') == 'on'
         settings.live_quotes_interval = int(request.POST.get('live_quotes_interval', 15))
-        settings.save()
+        settings.save(update_fields=['live_quotes_enabled', 'live_quotes_interval'])
         
         return redirect('lab_settings')
     
@@ -191,55 +219,52 @@ def lab_settings(request):
 @staff_member_required
 def lab_update_prices(request):
     """Manually trigger price update."""
-    from .models import SiteSettings, Portfolio, PriceHistory
-    from .services import PortfolioEngineV3
-    from django.utils import timezone
-    import yfinance as yf
-    from datetime import date
-    
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'POST required'})
     
     try:
         # Get all tickers from active portfolio
-        portfolio = Portfolio.objects.filter(id=2).first()
+        portfolio = get_portfolio('active')
         if not portfolio:
             return JsonResponse({'success': False, 'error': 'No active portfolio found'})
         
         # Get current holdings to find tickers
-        holdings = PortfolioEngineV3.get_current_holdings(portfolio)
+        holdings = PortfolioEngineV3.cached_call(portfolio, 'get_current_holdings')
         tickers = [h['ticker'] for h in holdings]
         
         if not tickers:
             return JsonResponse({'success': False, 'error': 'No tickers in portfolio'})
         
-        # Fetch latest prices
-        updated_count = 0
+        # Fetch latest prices in one batch request
         today = date.today()
         
-        for ticker in tickers:
-            try:
-                stock = yf.Ticker(ticker)
-                hist = stock.history(period='1d')
-                if not hist.empty:
-                    close_price = float(hist['Close'].iloc[-1])
-                    
-                    # Update or create price history
-                    PriceHistory.objects.update_or_create(
-                        ticker=ticker,
-                        date=today,
-                        defaults={'close_price': close_price}
-                    )
-                    updated_count += 1
-            except Exception as e:
-                print(f"Error updating {ticker}: {e}")
-                continue
+        try:
+            closes = dict(PortfolioEngineV3._download_closes(tickers, period='1d'))
+        except Exception as e:
+            logger.warning(f"[Lab Prices] Batch download error: {e}")
+            closes = {}
+        
+        # Tickers the batch missed are retried one request each, concurrently
+        missing = [ticker for ticker in tickers if ticker not in closes]
+        for ticker, close_price, error in PortfolioEngineV3._fetch_closes_per_ticker(missing):
+            if error:
+                logger.warning(f"[Lab Prices] Error updating {ticker}: {error}")
+            elif close_price is not None:
+                closes[ticker] = close_price
+        
+        # Update or create today's price history in one upsert
+        PriceHistory.objects.bulk_create(
+            [PriceHistory(ticker=ticker, date=today, close_price=close_price) for ticker, close_price in closes.items()],
+            update_conflicts=True,
+            unique_fields=['ticker', 'date'],
+            update_fields=['close_price'],
+        )
+        updated_count = len(closes)
+        if updated_count:
+            PortfolioEngineV3.invalidate_cache(portfolio)
         
         # Update settings with last update info
-        settings = SiteSettings.get_settings()
-        settings.last_quote_update = timezone.now()
-        settings.last_update_count = updated_count
-        settings.save()
+        SiteSettings.record_quote_update(updated_count)
         
         return JsonResponse({
             'success': True,
@@ -261,40 +286,59 @@ def fintest(request):
     return render(request, 'core/fintest.html')
 
 
+# Questions payload per edition; bumping the version (on any question change) expires all editions
+FINTEST_QUESTIONS_VERSION_KEY = 'fintest:questions:version'
+# Question edits bump the version only in the saving process unless the cache is shared
+FINTEST_QUESTIONS_CACHE_TIMEOUT = 60 * 60 if SHARED_CACHE else CACHE_TIMEOUT
+
+
+def clear_fintest_questions_cache():
+    """Expire the cached fintest_questions payloads (after questions are added, edited or deleted)."""
+    try:
+        cache.incr(FINTEST_QUESTIONS_VERSION_KEY)
+    except ValueError:
+        pass  # No version key (never set or evicted); the next request starts a fresh one
+
+
 def fintest_questions(request):
-    """API: Get active questions for the current edition."""
-    from .models import FintestQuestion, SiteSettings
-    
+    """API: Get active questions for the current edition (encoded payload cached per edition)."""
     settings = SiteSettings.get_settings()
     active_edition = settings.fintest_active_edition
     
-    questions = FintestQuestion.objects.filter(is_active=True, edition=active_edition).order_by('order')
-    data = []
-    
-    for q in questions:
-        data.append({
-            'id': q.id,
-            'text': q.text,
-            'options': [
-                {'id': 'A', 'text': q.option_a},
-                {'id': 'B', 'text': q.option_b},
-                {'id': 'C', 'text': q.option_c},
-                {'id': 'D', 'text': q.option_d},
-                {'id': 'E', 'text': q.option_e},
-            ]
-        })
+    # Seeded from the clock, so a version key that was evicted never repeats an old version
+    version = cache.get_or_set(FINTEST_QUESTIONS_VERSION_KEY, time.time_ns, None)
+    key = f'fintest:questions:v{version}:{active_edition}'
+    body = cache.get(key)
+    if body is None:
+        questions = FintestQuestion.objects.filter(is_active=True, edition=active_edition).order_by('order').values_list(
+            'id', 'text', 'option_a', 'option_b', 'option_c', 'option_d', 'option_e',
+        )
+        data = [
+            {
+                'id': question_id,
+                'text': text,
+                'options': [
+                    {'id': 'A', 'text': option_a},
+                    {'id': 'B', 'text': option_b},
+                    {'id': 'C', 'text': option_c},
+                    {'id': 'D', 'text': option_d},
+                    {'id': 'E', 'text': option_e},
+                ]
+            }
+            for question_id, text, option_a, option_b, option_c, option_d, option_e in questions
+        ]
         
-    return JsonResponse({
-        'questions': data,
-        'edition': active_edition
-    })
+        body = dumps({
+            'questions': data,
+            'edition': active_edition
+        })
+        cache.set(key, body, FINTEST_QUESTIONS_CACHE_TIMEOUT)
+    
+    return HttpResponse(body, content_type='application/json')
 
 
 def fintest_submit(request):
     """API: Submit quiz answers and save results."""
-    from .models import FintestQuestion, FintestResult, SiteSettings
-    import json
-    
     if request.method != 'POST':
         return JsonResponse({'error': 'POST required'}, status=405)
         
@@ -307,51 +351,56 @@ def fintest_submit(request):
         settings = SiteSettings.get_settings()
         active_edition = settings.fintest_active_edition
         
-        # Fetch active questions for this edition
-        questions = FintestQuestion.objects.filter(is_active=True, edition=active_edition)
+        # Fetch active questions for this edition (plain dicts of the fields used below)
+        questions = list(FintestQuestion.objects.filter(is_active=True, edition=active_edition).values(
+            'id', 'text', 'correct_answer', 'explanation',
+            'option_a', 'option_b', 'option_c', 'option_d', 'option_e',
+        ))
         results = []
         total_correct = 0
         
         for q in questions:
-            selected = answers.get(str(q.id))
-            is_correct = (selected == q.correct_answer)
+            selected = answers.get(str(q['id']))
+            is_correct = (selected == q['correct_answer'])
             if is_correct:
                 total_correct += 1
                 
             results.append({
-                'id': q.id,
-                'text': q.text,
+                'id': q['id'],
+                'text': q['text'],
                 'selected': selected,
-                'correct_answer': q.correct_answer,
+                'correct_answer': q['correct_answer'],
                 'is_correct': is_correct,
-                'explanation': q.explanation,
+                'explanation': q['explanation'],
                 'options': [
-                    {'id': 'A', 'text': q.option_a},
-                    {'id': 'B', 'text': q.option_b},
-                    {'id': 'C', 'text': q.option_c},
-                    {'id': 'D', 'text': q.option_d},
-                    {'id': 'E', 'text': q.option_e},
+                    {'id': 'A', 'text': q['option_a']},
+                    {'id': 'B', 'text': q['option_b']},
+                    {'id': 'C', 'text': q['option_c']},
+                    {'id': 'D', 'text': q['option_d']},
+                    {'id': 'E', 'text': q['option_e']},
                 ]
             })
             
         # Check for repeat user cookie
         is_repeat = request.COOKIES.get('fintest_completed') == 'true'
 
+        total_questions = len(questions)
+        
         # Save result to DB
         result_obj = FintestResult.objects.create(
             edition=active_edition,
             age_group=survey.get('age', ''),
             experience=survey.get('experience', ''),
-            total_questions=len(questions),
+            total_questions=total_questions,
             total_correct=total_correct,
             answers_json=results,
             is_repeat_user=is_repeat
         )
         
         response = JsonResponse({
-            'score_percent': int((total_correct / len(questions)) * 100) if questions else 0,
+            'score_percent': int((total_correct / total_questions) * 100) if total_questions else 0,
             'total_correct': total_correct,
-            'total_questions': len(questions),
+            'total_questions': total_questions,
             'results': results
         })
 